@@ -0,0 +1,252 @@
+import math
+import time
+import pickle
+import random
+import argparse
+import end_sampler
+import numpy as np
+from gamestate import GameState, END, MAX_ENDS
+from mcts import MCTS, MCTSNode, SearchStats, CountedEV, TimedEV, simulate
+
+ACTIONS = ("NO_PP", "PP")
+ACTION_INDEX = {a: i for i, a in enumerate(ACTIONS)}
+STATE_FIELDS = 13  # length of a GameState tuple
+
+# Flat tree storage: node i's statistics, parent, action and GameState fields
+# sit at row i of preallocated arrays that double in size when full. A node's
+# children take a contiguous block of rows, reserved for all its legal actions
+# when the first child is expanded and filled in expansion order, so selection
+# is a single vectorized UCB over children[first:first + count].
+
+class TreeStore:
+    def __init__(self, root_state, capacity=1024):
+        self.size = 0  # rows in use, including reserved child slots
+        self.nodes = 0
+        self.max_depth = 0
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.total_reward = np.zeros(capacity)
+        self.total_steps = np.zeros(capacity, dtype=np.int64)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.action = np.full(capacity, -1, dtype=np.int8)
+        self.depth = np.zeros(capacity, dtype=np.int16)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.n_children = np.zeros(capacity, dtype=np.int8)
+        self.n_legal = np.zeros(capacity, dtype=np.int8)
+        self.state = np.zeros((capacity, STATE_FIELDS), dtype=np.int16)
+        self.write(self.allocate(1), root_state, -1, -1)
+
+    ARRAYS = (
+        "visits", "total_reward", "total_steps", "parent", "action", "depth",
+        "first_child", "n_children", "n_legal", "state"
+    )
+
+    @property
+    def capacity(self):
+        return len(self.visits)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def allocate(self, n):
+        start = self.size
+        self.size += n
+        if self.size > self.capacity:
+            capacity = max(2 * self.capacity, self.size)
+            for name in self.ARRAYS:
+                old = getattr(self, name)
+                fill = -1 if name in ("parent", "action", "first_child") else 0
+                new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+        return start
+
+    def write(self, i, state, parent, action):
+        self.state[i] = state
+        self.parent[i] = parent
+        self.action[i] = action
+        self.n_legal[i] = len(state.legal_actions())
+        if parent >= 0:
+            self.depth[i] = self.depth[parent] + 1
+            self.max_depth = max(self.max_depth, int(self.depth[i]))
+        self.nodes += 1
+
+    def game_state(self, i):
+        return tuple.__new__(GameState, self.state[i].tolist())
+
+    def is_terminal(self, i):
+        return self.state[i, END] > self.state[i, MAX_ENDS]
+
+    def add_child(self, i, state, action):
+        if self.first_child[i] < 0:
+            self.first_child[i] = self.allocate(int(self.n_legal[i]))
+        child = self.first_child[i] + self.n_children[i]
+        self.n_children[i] += 1
+        self.write(child, state, i, ACTION_INDEX[action])
+        return child
+
+    def children(self, i):
+        start = self.first_child[i]
+        return range(start, start + self.n_children[i]) if start >= 0 else range(0)
+
+    def best_child(self, i, c_param=1.4):
+        start = self.first_child[i]
+        stop = start + self.n_children[i]
+        visits = self.visits[start:stop]
+        if visits.min() == 0:
+            return start + int(visits.argmin())  # first unvisited child
+        ucb = self.total_reward[start:stop] / visits + c_param * np.sqrt(math.log(self.visits[i]) / visits)
+        return start + int(ucb.argmax())
+
+    def backpropagate(self, path, reward, steps):
+        # path holds every node from the root down, so one fancy-indexed update
+        # replaces the walk up the parent pointers
+        self.visits[path] += 1
+        self.total_reward[path] += reward
+        self.total_steps[path] += steps
+
+    def exhausted(self):
+        n = self.size
+        created = self.action[:n] >= 0
+        created[0] = True
+        terminal = self.state[:n, END] > self.state[:n, MAX_ENDS]
+        expanded = self.n_children[:n] == self.n_legal[:n]
+        return bool(np.all(~created | terminal | expanded))
+
+    def __getstate__(self):
+        # only the rows in use, so trees pickle compactly for other processes
+        state = dict(self.__dict__)
+        for name in self.ARRAYS:
+            state[name] = getattr(self, name)[:self.size].copy()
+        return state
+
+
+class ArrayMCTS(MCTS):
+    # MCTS over a TreeStore instead of linked MCTSNode objects. Same search
+    # loop, UCB rule, expansion order and rewards as MCTS, so for a given seed
+    # it makes the same decisions; tree reuse is not supported.
+
+    def __init__(self, ev_model, num_simulations, reuse_tree=False, **kwargs):
+        if reuse_tree:
+            raise ValueError("reuse_tree is not supported by ArrayMCTS")
+        super().__init__(ev_model, num_simulations, **kwargs)
+        self.initial_capacity = 1024
+
+    def new_root(self, root_state):
+        return TreeStore(root_state, self.initial_capacity)
+
+    def root_children(self, tree):
+        return {ACTIONS[tree.action[c]]: (int(tree.visits[c]), float(tree.total_reward[c])) for c in tree.children(0)}
+
+    def record_tree(self, stats, tree):
+        stats.tree_size += tree.nodes
+        stats.max_depth = max(stats.max_depth, tree.max_depth)
+
+    def is_exhausted(self, tree):
+        return tree.exhausted()
+
+    def legal_count(self, tree):
+        return int(tree.n_legal[0])
+
+    def root_visits(self, tree):
+        return int(tree.visits[0])
+
+    def grow(self, tree, num_simulations, stats=None):
+        stats = SearchStats() if stats is None else stats
+        ev_model = TimedEV(self.ev_model) if self.profile else CountedEV(self.ev_model)
+        clock = time.perf_counter
+        selection = expansion = rollout = backprop = 0.0
+
+        for _ in range(num_simulations):
+            t0 = clock()
+            i = 0
+            path = [0]
+            while tree.n_children[i] == tree.n_legal[i] and tree.n_children[i] > 0:
+                i = tree.best_child(i)
+                path.append(i)
+            t1 = clock()
+
+            state = tree.game_state(i)
+            if not state.is_terminal():
+                tried = [ACTIONS[tree.action[c]] for c in tree.children(i)]
+                untried = [a for a in state.legal_actions() if a not in tried]
+                if untried:
+                    action = random.choice(untried)
+                    state = state.next_state(action)
+                    i = tree.add_child(i, state, action)
+                    path.append(i)
+            stats.rollouts += self.leaf_rollouts(state)
+            t2 = clock()
+
+            reward = simulate(state, ev_model, self.rollouts_per_leaf, self.rollout_engine, self.leaf_depth)
+            t3 = clock()
+
+            steps = max(state.max_ends - state.end_number + 1, 0)
+            tree.backpropagate(path, reward, steps)
+            if len(path) > 1:
+                stats.record_reward(ACTIONS[tree.action[path[1]]], reward)
+            t4 = clock()
+
+            selection += t1 - t0
+            expansion += t2 - t1
+            rollout += t3 - t2
+            backprop += t4 - t3
+
+        stats.simulations += num_simulations
+        stats.ev_calls += ev_model.calls
+        if self.profile:
+            stats.time["selection"] += selection
+            stats.time["expansion"] += expansion
+            stats.time["rollout"] += rollout - ev_model.time
+            stats.time["ev"] += ev_model.time
+            stats.time["backprop"] += backprop
+        return stats
+
+
+def object_tree_bytes(root_node):
+    # rough footprint of a linked MCTSNode tree: node objects, their attribute
+    # dicts, children lists and the embedded GameState tuples
+    import sys
+    total = 0
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        total += sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.children) + sys.getsizeof(node.state)
+        stack.extend(node.children)
+    return total
+
+
+if __name__ == "__main__":
+    from bayesian_ev import bayesian_eval_cached
+
+    parser = argparse.ArgumentParser(description="Compare the array-backed MCTS tree against linked MCTSNode objects")
+    parser.add_argument("--simulations", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    state = GameState(
+        current_score = {1: 0, 2: 0},
+        end_number = 3,
+        root_team = 1,
+        hammer_team = 1,
+        powerplay_used = {1: False, 2: False}
+    )
+
+    print(f"{'simulations':>11} {'tree':>7} {'nodes':>6} {'s':>7} {'bytes/node':>10} {'pickle B':>9} {'action':>7}")
+    for n in args.simulations:
+        for name, cls in [("object", MCTS), ("array", ArrayMCTS)]:
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+            end_sampler.seed(args.seed)
+            mcts = cls(bayesian_eval_cached, n)
+            start = time.perf_counter()
+            result = mcts.search(state)
+            elapsed = time.perf_counter() - start
+
+            root = mcts.root
+            if isinstance(root, MCTSNode):
+                size = object_tree_bytes(root)
+            else:
+                size = sum(getattr(root, a)[:root.size].nbytes for a in TreeStore.ARRAYS)
+            pickled = len(pickle.dumps(root, protocol=pickle.HIGHEST_PROTOCOL))
+            print(f"{n:>11} {name:>7} {result.tree_size:>6} {elapsed:>7.3f} {size / result.tree_size:>10.0f} {pickled:>9} {result.action:>7}")
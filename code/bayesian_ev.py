@@ -1,18 +1,293 @@
-import torch
+import math
+import argparse
+import numpy as np
 from pathlib import Path
+from collections import OrderedDict
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-WEIGHTS_ROOT = PROJECT_ROOT / "weights" 
-
-posterior_cont = torch.load(WEIGHTS_ROOT / "testing_weights" / "unitddpm_BaysianRegression_20260111_193054_82cf67d5_weights.pt")
-production = torch.load(WEIGHTS_ROOT / "unitddpm_BaysianRegression_20260111_193019_830f987c_weights.pt")
-
-def bayesian_eval_continuous(features, posterior = production):
-    f = torch.tensor([list(features.values())], dtype=torch.float)
-    
-    mu_samples = f @ posterior["w"].T + posterior["b"] 
-    
-    ev_mean = mu_samples.mean().item()
-    ev_std = mu_samples.std().item()
-    
+WEIGHTS_ROOT = PROJECT_ROOT / "weights"
+
+# column order of posterior["w"]; matches the features used in train_bayesian_model.py
+FEATURES = ["HasHammer", "PowerPlayBool", "EndID", "PrevScoreDiff", "PrevEndDiff"]
+FEATURE_ALIASES = {"Has_Hammer": "HasHammer"}
+
+POSTERIOR_FILES = {
+    "posterior_cont": WEIGHTS_ROOT / "testing_weights" / "unitddpm_BaysianRegression_20260111_193054_82cf67d5_weights.pt",
+    "production": WEIGHTS_ROOT / "unitddpm_BaysianRegression_20260111_193019_830f987c_weights.pt",
+}
+
+_posteriors = {}
+
+def load_posterior(path):
+    # .npz exports load with NumPy alone; torch is only imported for .pt files.
+    # Each load returns a new object, which invalidates any EVCache bound to the old one.
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path) as data:
+            return {k: data[k] for k in data.files}
+
+    import torch
+    return {k: v.numpy() for k, v in torch.load(path).items()}
+
+def export_posterior(path, out=None):
+    out = Path(path).with_suffix(".npz") if out is None else Path(out)
+    posterior = load_posterior(path)
+    np.savez(out, **posterior)
+    return out
+
+def get_posterior(name = "production"):
+    if name not in _posteriors:
+        path = POSTERIOR_FILES[name]
+        if path.with_suffix(".npz").exists():
+            path = path.with_suffix(".npz")
+        _posteriors[name] = load_posterior(path)
+    return _posteriors[name]
+
+def __getattr__(name):
+    # keeps bayesian_ev.production / bayesian_ev.posterior_cont working without loading at import
+    if name in POSTERIOR_FILES:
+        return get_posterior(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def feature_row(features):
+    named = {FEATURE_ALIASES.get(k, k): v for k, v in features.items()}
+    return [named[name] for name in FEATURES]
+
+def feature_matrix(rows):
+    if len(rows) and hasattr(rows[0], "features_for_ev"):
+        rows = [feature_row(s.features_for_ev(s.root_team)) for s in rows]
+    return np.asarray(rows, dtype=np.float32).reshape(-1, len(FEATURES))
+
+def bayesian_eval_batch(rows, posterior = None):
+    posterior = get_posterior() if posterior is None else posterior
+    f = feature_matrix(rows)
+
+    mu_samples = f @ posterior["w"].T + posterior["b"]
+
+    ev_mean = mu_samples.mean(axis=1)
+    ev_std = mu_samples.std(axis=1, ddof=1)
+
     return ev_mean, ev_std
+
+def bayesian_eval_continuous(features, posterior = None):
+    ev_mean, ev_std = bayesian_eval_batch([feature_row(features)], posterior)
+    return ev_mean[0].item(), ev_std[0].item()
+
+def feature_grid(max_end = 9, max_score_diff = 48, max_end_diff = 6):
+    # every feature row reachable in a game, shaped (2, 2, ends, score diffs, end diffs, 5)
+    return np.stack(np.meshgrid(
+        [0, 1],
+        [0, 1],
+        np.arange(1, max_end + 1),
+        np.arange(-max_score_diff, max_score_diff + 1),
+        np.arange(-max_end_diff, max_end_diff + 1),
+        indexing="ij"
+    ), axis=-1)
+
+def bayesian_eval_quantiles(rows, q, posterior = None):
+    # quantiles of the EV over the posterior draws; needs the full samples
+    posterior = get_posterior() if posterior is None else posterior
+    mu_samples = feature_matrix(rows) @ posterior["w"].T + posterior["b"]
+    return np.quantile(mu_samples, q, axis=1)
+
+
+class PosteriorMoments:
+    # The EV f @ w + b is linear in (w, b), so its mean and variance over the
+    # draws are z @ mean and z @ cov @ z with z = (f, 1), where mean and cov
+    # are the sample moments of (w, b). That gives the same numbers as
+    # bayesian_eval_batch from (d+1) + (d+1)^2 values instead of S draws.
+
+    def __init__(self, mean, cov):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.cov = np.asarray(cov, dtype=np.float64)
+
+    @classmethod
+    def from_posterior(cls, posterior):
+        beta = np.column_stack([posterior["w"], posterior["b"]]).astype(np.float64)
+        return cls(beta.mean(axis=0), np.cov(beta, rowvar=False, ddof=1))
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, cov=self.cov)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["mean"], data["cov"])
+
+    def evaluate_batch(self, rows):
+        z = np.column_stack([feature_matrix(rows).astype(np.float64), np.ones(len(rows))])
+        ev_var = np.einsum("ij,jk,ik->i", z, self.cov, z)
+        return z @ self.mean, np.sqrt(np.maximum(ev_var, 0.0))
+
+    def evaluate(self, features):
+        z = np.array(feature_row(features) + [1.0])
+        ev_var = float(z @ self.cov @ z)
+        return float(z @ self.mean), math.sqrt(max(ev_var, 0.0))
+
+
+_moments = {}
+
+def get_moments(name = "production"):
+    if name not in _moments:
+        _moments[name] = PosteriorMoments.from_posterior(get_posterior(name))
+    return _moments[name]
+
+def bayesian_eval_moments(features, moments = None):
+    moments = get_moments() if moments is None else moments
+    return moments.evaluate(features)
+
+def bayesian_eval_batch_moments(rows, moments = None):
+    moments = get_moments() if moments is None else moments
+    return moments.evaluate_batch(rows)
+
+def check_moments(posterior, rows):
+    # largest differences between the moment and sample-based EV mean and std
+    moments = PosteriorMoments.from_posterior(posterior)
+    ev_mean, ev_std = bayesian_eval_batch(rows, posterior)
+    m_mean, m_std = moments.evaluate_batch(rows)
+    return float(np.abs(ev_mean - m_mean).max()), float(np.abs(ev_std - m_std).max())
+
+
+class EVCache:
+    # Memoizes EV lookups keyed by the (HasHammer, PowerPlayBool, EndID,
+    # PrevScoreDiff, PrevEndDiff) tuple. Entries are filled lazily with LRU
+    # eviction, or precompute() fills a dense array over the reachable grid.
+    # Everything is dropped as soon as a different posterior is passed in.
+
+    def __init__(self, maxsize = 65536):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.posterior = None
+        self.dense = None
+        self.dense_entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, posterior):
+        posterior = get_posterior() if posterior is None else posterior
+        if posterior is not self.posterior:
+            self.clear()
+            self.posterior = posterior
+
+    def clear(self):
+        self.entries.clear()
+        self.dense = None
+        self.dense_entries = {}
+        self.posterior = None
+
+    def precompute(self, posterior = None, max_end = 9, max_score_diff = 48, max_end_diff = 6):
+        self.bind(posterior)
+        grid = feature_grid(max_end, max_score_diff, max_end_diff)
+        rows = grid.reshape(-1, len(FEATURES))
+        ev_mean, ev_std = bayesian_eval_batch(rows, posterior)
+        self.dense = np.stack([ev_mean, ev_std], axis=-1).reshape(grid.shape[:-1] + (2,))
+        self.dense_entries = dict(zip(map(tuple, rows.tolist()), zip(ev_mean.tolist(), ev_std.tolist())))
+        self.offsets = np.array([0, 0, -1, max_score_diff, max_end_diff])
+        return self.dense
+
+    def dense_index(self, rows):
+        idx = np.asarray(rows).astype(np.intp) + self.offsets
+        inside = np.all((idx >= 0) & (idx < self.dense.shape[:-1]), axis=-1)
+        return idx, inside
+
+    def evaluate(self, features, posterior = None):
+        self.bind(posterior)
+        key = tuple(feature_row(features))
+
+        value = self.dense_entries.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+        self.misses += 1
+        ev_mean, ev_std = bayesian_eval_batch([key], posterior)
+        value = (ev_mean[0].item(), ev_std[0].item())
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def evaluate_batch(self, rows, posterior = None):
+        self.bind(posterior)
+        rows = feature_matrix(rows)
+        if self.dense is None:
+            self.precompute(posterior)
+
+        idx, inside = self.dense_index(rows)
+        if inside.all():
+            self.hits += len(rows)
+            values = self.dense[tuple(idx.T)]
+            return values[:, 0], values[:, 1]
+
+        # grid rows come from the table, only the rows off the grid go through the model
+        self.hits += int(inside.sum())
+        self.misses += int((~inside).sum())
+        values = np.empty((len(rows), 2), dtype=self.dense.dtype)
+        values[inside] = self.dense[tuple(idx[inside].T)]
+        ev_mean, ev_std = bayesian_eval_batch(rows[~inside], posterior)
+        values[~inside, 0] = ev_mean
+        values[~inside, 1] = ev_std
+        return values[:, 0], values[:, 1]
+
+    def info(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+            "dense": self.dense is not None
+        }
+
+
+ev_cache = EVCache()
+
+def bayesian_eval_cached(features, posterior = None):
+    return ev_cache.evaluate(features, posterior)
+
+def bayesian_eval_batch_cached(rows, posterior = None):
+    return ev_cache.evaluate_batch(rows, posterior)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export .pt posteriors to NumPy .npz files")
+    parser.add_argument("paths", nargs="*", type=Path, help="defaults to every posterior in POSTERIOR_FILES")
+    parser.add_argument("--check-moments", action="store_true", help="instead of exporting, compare moment-based EVs with the sample-based ones over the precompute grid")
+    parser.add_argument("--calls", type=int, default=20000, help="single-state calls timed by --check-moments")
+    args = parser.parse_args()
+
+    if not args.check_moments:
+        for path in args.paths or POSTERIOR_FILES.values():
+            print(f"Exported {path} -> {export_posterior(path)}")
+    else:
+        import time
+
+        rows = feature_grid().reshape(-1, len(FEATURES))
+        for path in args.paths or POSTERIOR_FILES.values():
+            posterior = load_posterior(path)
+            mean_diff, std_diff = check_moments(posterior, rows)
+            print(f"{Path(path).name}: {len(rows)} states, max |mean diff| {mean_diff:.2e}, max |std diff| {std_diff:.2e}")
+
+            moments = PosteriorMoments.from_posterior(posterior)
+            features = dict(zip(FEATURES, rows[len(rows) // 3].tolist()))
+            timings = {}
+            for name, fn, arg in [("samples", bayesian_eval_continuous, posterior), ("moments", bayesian_eval_moments, moments)]:
+                start = time.perf_counter()
+                for _ in range(args.calls):
+                    fn(features, arg)
+                timings[name] = (time.perf_counter() - start) / args.calls
+            print(f"  single state: samples {timings['samples'] * 1e6:.1f} us, moments {timings['moments'] * 1e6:.1f} us ({timings['samples'] / timings['moments']:.1f}x)")
+
+            start = time.perf_counter()
+            bayesian_eval_batch(rows, posterior)
+            batch_time = time.perf_counter() - start
+            start = time.perf_counter()
+            moments.evaluate_batch(rows)
+            moment_time = time.perf_counter() - start
+            print(f"  {len(rows)}-state batch: samples {batch_time * 1000:.1f} ms, moments {moment_time * 1000:.1f} ms ({batch_time / moment_time:.1f}x)")
@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import end_sampler
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from gamestate import GameState
+from mcts import MCTS, MCTSNode
+from bayesian_ev import bayesian_eval_continuous, bayesian_eval_moments, get_moments, get_posterior
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+BENCHMARK_PATH = PROJECT_ROOT / "figures" / "analysis" / "simulation_statistics" / "benchmark.json"
+
+# Each case times `fn(size)` from the same seeds on every repeat, so two runs
+# of the suite do identical work and only the wall time differs.
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    end_sampler.seed(seed)
+
+def opening_state():
+    return GameState(
+        current_score = {1: 0, 2: 0},
+        end_number = 3,
+        root_team = 1,
+        hammer_team = 1,
+        powerplay_used = {1: False, 2: False}
+    )
+
+def bench_next_state(n):
+    state = opening_state()
+    for _ in range(n):
+        state.next_state("NO_PP")
+
+def bench_sample_end_score(n):
+    state = opening_state()
+    for _ in range(n):
+        state.sample_end_score("PP")
+
+def bench_bayesian_eval(n):
+    features = opening_state().features_for_ev(1)
+    for _ in range(n):
+        bayesian_eval_continuous(features)
+
+def bench_bayesian_eval_moments(n):
+    features = opening_state().features_for_ev(1)
+    for _ in range(n):
+        bayesian_eval_moments(features)
+
+def bench_simulate(n):
+    node = MCTSNode(opening_state())
+    for _ in range(n):
+        node.simulate(bayesian_eval_continuous)
+
+def bench_search(n):
+    MCTS(bayesian_eval_continuous, n).search(opening_state())
+
+def bench_search_leaf0(n):
+    MCTS(bayesian_eval_continuous, n, leaf_depth=0).search(opening_state())
+
+def bench_match(n):
+    from run_mcts import MatchStats, play_match
+    play_match(MatchStats(1), MCTS(bayesian_eval_continuous, n))
+
+# name -> (function, sizes, unit that `size` counts)
+CASES = {
+    "GameState.next_state": (bench_next_state, [1000, 10000, 100000], "calls"),
+    "GameState.sample_end_score": (bench_sample_end_score, [1000, 10000, 100000], "calls"),
+    "bayesian_eval_continuous": (bench_bayesian_eval, [100, 1000, 10000], "calls"),
+    "bayesian_eval_moments": (bench_bayesian_eval_moments, [100, 1000, 10000], "calls"),
+    "MCTSNode.simulate": (bench_simulate, [10, 100, 1000], "rollouts"),
+    "MCTS.search": (bench_search, [100, 1000, 10000], "simulations"),
+    "MCTS.search(leaf_depth=0)": (bench_search_leaf0, [100, 1000, 10000], "simulations"),
+    "run_mcts.play_match": (bench_match, [100, 1000], "simulations/search"),
+}
+
+
+def run_case(fn, size, repeats, seed):
+    seed_all(seed)
+    fn(size)  # warm up caches and lazy imports
+    times = []
+    for _ in range(repeats):
+        seed_all(seed)
+        start = time.perf_counter()
+        fn(size)
+        times.append(time.perf_counter() - start)
+    return {
+        "size": size,
+        "repeats": repeats,
+        "min": min(times),
+        "median": statistics.median(times),
+        "times": times
+    }
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count()
+    }
+
+def run_suite(repeats = 5, seed = 0, only = None, max_size = None):
+    get_posterior()  # load the weights outside the timed region
+    get_moments()
+    results = {}
+    for name, (fn, sizes, unit) in CASES.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        for size in sizes:
+            if max_size is not None and size > max_size:
+                continue
+            row = run_case(fn, size, repeats, seed)
+            row["unit"] = unit
+            results[f"{name}[{size}]"] = row
+            print(f"{name:<28} {size:>7} {unit:<18} median {row['median'] * 1000:10.2f} ms")
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "seed": seed,
+        "machine": machine_info(),
+        "results": results
+    }
+
+def compare(current, baseline, threshold = 0.25):
+    # a case regresses when its best time is more than `threshold` slower than
+    # the baseline's; min is less noisy than median for short timings
+    regressions = []
+    print(f"{'case':<40} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for key, row in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+        old = baseline["results"][key]["min"]
+        new = row["min"]
+        change = new / old - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<40} {old * 1000:>12.2f} {new * 1000:>12.2f} {change:>+8.1%}{flag}")
+
+    if current["machine"] != baseline["machine"]:
+        print("Note: baseline was recorded on a different machine")
+    return regressions
+
+
+def leaf_agreement(n_states, num_simulations, depths, seed = 0):
+    # decisions with depth-limited / analytic leaves against full rollouts on
+    # the same sampled states; a second full-rollout run with another seed
+    # gives the agreement expected from sampling noise alone
+    from policy_solver import sample_states
+    from bayesian_ev import bayesian_eval_cached
+
+    states = sample_states(n_states, np.random.default_rng(seed))
+
+    def decide(run_seed, leaf_depth):
+        seed_all(run_seed)
+        start = time.perf_counter()
+        actions = [MCTS(bayesian_eval_cached, num_simulations, leaf_depth=leaf_depth).search(s).action for s in states]
+        return actions, time.perf_counter() - start
+
+    reference, reference_time = decide(seed + 1, None)
+    print(f"{'leaf_depth':>10} {'agreement':>10} {'seconds':>8} {'speedup':>8}")
+    for i, depth in enumerate([None] + list(depths)):
+        actions, elapsed = decide(seed + 2 + i, depth)
+        agree = np.mean([a == b for a, b in zip(actions, reference)])
+        print(f"{str(depth):>10} {agree:>10.1%} {elapsed:>8.2f} {reference_time / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the search and simulation hot paths")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="run cases whose name contains any of these strings")
+    parser.add_argument("--max-size", type=int, help="skip sizes above this")
+    parser.add_argument("--out", type=Path, default=BENCHMARK_PATH)
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="flag cases slower than this saved run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before a case is flagged")
+    parser.add_argument("--leaf-agreement", type=int, default=0, metavar="N", help="instead of timing, compare leaf_depth settings against full rollouts on N states")
+    parser.add_argument("--leaf-depths", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--simulations", type=int, default=1000, help="simulations per search for --leaf-agreement")
+    args = parser.parse_args()
+
+    if args.leaf_agreement:
+        leaf_agreement(args.leaf_agreement, args.simulations, args.leaf_depths, args.seed)
+        sys.exit(0)
+
+    # read the baseline before the run, since --out may overwrite the same file
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_suite(args.repeats, args.seed, args.only, args.max_size)
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Saved benchmark results to: {args.out}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,189 @@
+import math
+import time
+import argparse
+import end_sampler
+import numpy as np
+from mcts import MCTS, MCTSNode, win_prob
+from gamestate import GameState
+from prob_table import end_distribution
+
+# Decision nodes live in a transposition table keyed on GameState.key(), so
+# every path that reaches an equivalent position (score diff, end, hammer,
+# powerplays remaining, previous end diff, all relative to the root team)
+# updates the same statistics. Each action leads to a chance node with one
+# branch per outcome of the end's distribution (the hammer lead's bucket when
+# the table has score buckets), and action values are the exact
+# probability-weighted average over the outcomes sampled so far.
+
+class ChanceNode:
+    def __init__(self, state, action):
+        self.action = action
+        self.visits = 0
+        self.total_reward = 0.0
+        self.dist = end_distribution(action, state.end_number, state.hammer_lead)
+        self.outcomes = {}  # result -> (next state key, next state, immediate reward)
+
+    def value(self, table):
+        mass = 0.0
+        total = 0.0
+        for result, (key, _, reward) in self.outcomes.items():
+            node = table[key]
+            p = self.dist[result]
+            mass += p
+            total += p * (reward + node.total_reward / node.visits)
+        if mass == 0:
+            return self.total_reward / max(1, self.visits)
+        return total / mass
+
+
+class DecisionNode:
+    def __init__(self, state):
+        self.state = state
+        self.visits = 0
+        self.total_reward = 0.0
+        self.children = {}
+        if not state.is_terminal():
+            self.children = {a: ChanceNode(state, a) for a in state.legal_actions()}
+
+    def best_action(self, table, c_param=1.4):
+        best = None
+        best_ucb = -float("inf")
+
+        for action, child in self.children.items():
+            if child.visits == 0:
+                return action
+
+            ucb = child.value(table) + c_param * math.sqrt(math.log(self.visits) / child.visits)
+
+            if ucb > best_ucb:
+                best_ucb = ucb
+                best = action
+
+        return best
+
+
+class ChanceMCTS:
+    def __init__(self, ev_model, num_simulations, table=None):
+        self.ev_model = ev_model
+        self.num_simulations = num_simulations
+        self.table = {} if table is None else table
+
+    def step_reward(self, state):
+        root = state.root_team
+        opp = [t for t in state.current_score if t != root][0]
+
+        ev_root, _ = self.ev_model(state.features_for_ev(root))
+        ev_opp, _ = self.ev_model(state.features_for_ev(opp))
+        ends_left = state.max_ends - state.end_number + 1
+        return win_prob(ev_root - ev_opp, ends_left)
+
+    def simulate(self, node):
+        path = []
+        while not node.state.is_terminal():
+            action = node.best_action(self.table)
+            chance = node.children[action]
+
+            result = node.state.sample_end_result(action)
+            if result not in chance.outcomes:
+                next_state = node.state.transition(action, result)
+                chance.outcomes[result] = (next_state.key(), next_state, self.step_reward(next_state))
+            key, next_state, reward = chance.outcomes[result]
+            path.append((node, chance, reward))
+
+            if key not in self.table:
+                node = self.table[key] = DecisionNode(next_state)
+                break
+            node = self.table[key]
+
+        ret = 0.0
+        if not node.state.is_terminal():
+            ret = MCTSNode(node.state).simulate(self.ev_model)
+        node.visits += 1
+        node.total_reward += ret
+
+        for parent, chance, reward in reversed(path):
+            ret += reward
+            chance.visits += 1
+            chance.total_reward += ret
+            parent.visits += 1
+            parent.total_reward += ret
+
+    def search(self, root_state):
+        key = root_state.key()
+        if key not in self.table:
+            self.table[key] = DecisionNode(root_state)
+        root = self.table[key]
+        for _ in range(self.num_simulations):
+            self.simulate(root)
+
+        best = max(root.children.values(), key=lambda c: c.value(self.table))
+        return best.action, best.value(self.table)
+
+
+def sample_states(n, rng):
+    states = []
+    for _ in range(n):
+        lead = int(rng.integers(-3, 4))
+        states.append(GameState(
+            current_score = {1: max(lead, 0), 2: max(-lead, 0)},
+            end_number = int(rng.integers(3, 9)),
+            root_team = 1,
+            hammer_team = 1,
+            powerplay_used = {1: False, 2: False},
+            powerplays_remaining = {1: 1, 2: int(rng.integers(0, 2))}
+        ))
+    return states
+
+
+def stable_budget(make_search, state, budgets, repeats, reference):
+    # smallest budget from which every larger budget returns the reference
+    # decision in at least 90% of independent repeats
+    stable = None
+    for budget in reversed(budgets):
+        hits = sum(make_search(budget).search(state)[0] == reference for _ in range(repeats))
+        if hits / repeats < 0.9:
+            break
+        stable = budget
+    return stable
+
+
+def compare(ev_model, n_states, budgets, repeats, seed=0):
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    end_sampler.seed(seed)
+    searches = {
+        "MCTS": lambda n: MCTS(ev_model, n),
+        "ChanceMCTS": lambda n: ChanceMCTS(ev_model, n),
+    }
+    print(f"{'state':<28}" + "".join(f"{name:>14}" for name in searches))
+    totals = {name: [] for name in searches}
+    for state in sample_states(n_states, rng):
+        row = []
+        for name, make_search in searches.items():
+            start = time.perf_counter()
+            decisions = [make_search(budgets[-1]).search(state)[0] for _ in range(repeats)]
+            reference = max(set(decisions), key=decisions.count)
+            budget = stable_budget(make_search, state, budgets, repeats, reference)
+            totals[name].append((budget, time.perf_counter() - start))
+            row.append(f"{'>' + str(budgets[-1]) if budget is None else budget:>14}")
+        lead = state.current_score[1] - state.current_score[2]
+        print(f"end {state.end_number} lead {lead:+d} opp_pp {state.powerplays_remaining[2]:<10}" + "".join(row))
+
+    for name, results in totals.items():
+        stable = [b for b, _ in results if b is not None]
+        median = int(np.median(stable)) if stable else None
+        print(f"{name}: stable on {len(stable)}/{len(results)} states, median budget {median}, "
+              f"{sum(t for _, t in results):.1f}s total")
+
+
+if __name__ == "__main__":
+    from bayesian_ev import bayesian_eval_continuous
+
+    parser = argparse.ArgumentParser(description="Simulations-to-stable-decision: MCTS vs ChanceMCTS")
+    parser.add_argument("--states", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[25, 50, 100, 200, 400, 800, 1600])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    compare(bayesian_eval_continuous, args.states, sorted(args.budgets), args.repeats, args.seed)
@@ -0,0 +1,198 @@
+import io
+import json
+import time
+import hashlib
+import tempfile
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = PROJECT_ROOT / "data_processing" / "train_test_data"
+SAVE_DIR = PROJECT_ROOT / "weights" / "testing_weights"
+
+features = ["Has_Hammer",
+            "PowerPlayBool",
+            "EndID",
+            "PrevScoreDiff",
+            "PrevEndDiff"]
+
+# The same linear model as BaysianRegression in train_bayesian_model.py, with
+# the conjugate Normal-Inverse-Gamma prior in place of the independent
+# Normal / HalfCauchy priors:
+#
+#   sigma^2 ~ InvGamma(a0, b0)
+#   beta | sigma^2 ~ Normal(0, sigma^2 * prior_scale^2 * I),  beta = (w, b)
+#
+# The posterior is NIG again and depends on the data only through
+# X^T X, X^T y, y^T y and n, so fitting is a (d+1)x(d+1) solve and new ends
+# can be folded in by adding their statistics. For every CSV folded in, the
+# statistics keep its path, the number of rows added and a hash of those
+# rows, so rerunning on a file adds only rows appended since, and a file
+# whose absorbed rows were edited is rejected instead of counted again.
+
+class ConjugateRegression:
+    def __init__(self, d = len(features), prior_scale = 1.0, a0 = 1.0, b0 = 1.0):
+        self.d = d
+        self.prior_scale = prior_scale
+        self.a0 = a0
+        self.b0 = b0
+        self.xtx = np.zeros((d + 1, d + 1))
+        self.xty = np.zeros(d + 1)
+        self.yty = 0.0
+        self.n = 0
+        self.sources = {}  # resolved CSV path -> {"rows": rows added, "sha256": hash of those rows}
+
+    @staticmethod
+    def design(X):
+        # intercept column last, so beta[:-1] is w and beta[-1] is b
+        X = np.asarray(X, dtype=np.float64)
+        return np.hstack([X, np.ones((len(X), 1))])
+
+    def update(self, X, y):
+        Z = self.design(X)
+        y = np.asarray(y, dtype=np.float64)
+        self.xtx += Z.T @ Z
+        self.xty += Z.T @ y
+        self.yty += float(y @ y)
+        self.n += len(y)
+        return self
+
+    def posterior_params(self):
+        # (mean, precision, a, b) of the NIG posterior on (beta, sigma^2)
+        precision = self.xtx + np.eye(self.d + 1) / self.prior_scale ** 2
+        mean = np.linalg.solve(precision, self.xty)
+        a = self.a0 + self.n / 2
+        b = self.b0 + 0.5 * (self.yty - self.xty @ mean)
+        return mean, precision, a, b
+
+    def sample(self, num_samples = 1000, rng = None):
+        # draws in the {"w", "b", "sigma"} layout of the NUTS weights files
+        rng = np.random.default_rng() if rng is None else rng
+        mean, precision, a, b = self.posterior_params()
+
+        sigma2 = b / rng.gamma(a, size=num_samples)
+        # beta = mean + sigma * L^-T z with precision = L L^T has covariance sigma^2 * precision^-1
+        L = np.linalg.cholesky(precision)
+        z = rng.standard_normal((num_samples, self.d + 1))
+        beta = mean + np.sqrt(sigma2)[:, None] * np.linalg.solve(L.T, z.T).T
+
+        return {
+            "w": beta[:, :-1].astype(np.float32),
+            "b": beta[:, -1].astype(np.float32),
+            "sigma": np.sqrt(sigma2).astype(np.float32)
+        }
+
+    def save(self, path):
+        np.savez(
+            path, xtx=self.xtx, xty=self.xty, yty=self.yty, n=self.n,
+            prior=np.array([self.prior_scale, self.a0, self.b0]),
+            sources=np.array(json.dumps(self.sources))
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            prior_scale, a0, b0 = data["prior"]
+            model = cls(len(data["xty"]) - 1, prior_scale, a0, b0)
+            model.xtx = data["xtx"]
+            model.xty = data["xty"]
+            model.yty = float(data["yty"])
+            model.n = int(data["n"])
+            sources = json.loads(str(data["sources"])) if "sources" in data.files else {}
+            if not isinstance(sources, dict):
+                raise ValueError(f"{path} records whole-file hashes only; rebuild it from the CSVs")
+            model.sources = sources
+        return model
+
+
+def load_ends(path):
+    df = pd.read_csv(path)
+    return df[features].values, df["Result"].values
+
+def rows_digest(header, rows):
+    return hashlib.sha256(b"\n".join(line.rstrip(b"\r\n") for line in [header] + rows)).hexdigest()
+
+def absorb(model, path):
+    # add the rows of path that are not in the statistics yet; returns how many
+    lines = Path(path).read_bytes().splitlines()
+    header, rows = lines[0], [line for line in lines[1:] if line.strip()]
+    key = str(Path(path).resolve())
+
+    start = 0
+    seen = model.sources.get(key)
+    if seen is not None:
+        start = seen["rows"]
+        if start > len(rows) or rows_digest(header, rows[:start]) != seen["sha256"]:
+            raise ValueError(f"{path} no longer starts with the {start} rows already added; only appended rows can be added")
+    if start < len(rows):
+        df = pd.read_csv(io.BytesIO(b"\n".join([header] + rows[start:])))
+        model.update(df[features].values, df["Result"].values)
+    model.sources[key] = {"rows": len(rows), "sha256": rows_digest(header, rows)}
+    return len(rows) - start
+
+def check_split(X, y, seed = 0):
+    # fit two disjoint random halves in turn, passing the statistics through
+    # save / load, and compare every posterior parameter with one batch fit
+    order = np.random.default_rng(seed).permutation(len(y))
+    first, second = order[:len(y) // 2], order[len(y) // 2:]
+    batch = ConjugateRegression().update(X, y).posterior_params()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "stats.npz"
+        ConjugateRegression().update(X[first], y[first]).save(path)
+        online = ConjugateRegression.load(path).update(X[second], y[second]).posterior_params()
+    return max(float(np.abs(np.asarray(a) - np.asarray(b)).max()) for a, b in zip(batch, online))
+
+
+if __name__ == "__main__":
+    from bayesian_ev import POSTERIOR_FILES, bayesian_eval_batch, get_posterior, load_posterior
+
+    parser = argparse.ArgumentParser(description="Fit the EV regression with a conjugate Normal-Inverse-Gamma prior")
+    parser.add_argument("--data", nargs="+", type=Path, default=[DATA_DIR / "train_df.csv"], help="CSVs of ends to add; for files already in --stats only appended rows are added")
+    parser.add_argument("--stats", type=Path, help="sufficient statistics to start from; updated in place")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default="production", help="posterior name or path to compare against")
+    args = parser.parse_args()
+
+    if args.stats is not None and args.stats.exists():
+        model = ConjugateRegression.load(args.stats)
+        print(f"Loaded statistics for {model.n} ends from {args.stats}")
+    else:
+        model = ConjugateRegression()
+
+    start = time.perf_counter()
+    for path in args.data:
+        added = absorb(model, path)
+        print(f"Added {added} new rows from {path}")
+    posterior = model.sample(args.samples, np.random.default_rng(args.seed))
+    elapsed = time.perf_counter() - start
+    print(f"Fit on {model.n} ends and drew {args.samples} samples in {elapsed * 1000:.2f} ms")
+
+    # two disjoint halves folded in one after the other must reach the batch posterior
+    data = [load_ends(path) for path in args.data]
+    X, y = np.vstack([X for X, _ in data]), np.concatenate([y for _, y in data])
+    print(f"max |batch - incremental| over posterior mean, precision, a, b: {check_split(X, y, args.seed):.2e}")
+
+    baseline = get_posterior(args.baseline) if args.baseline in POSTERIOR_FILES else load_posterior(args.baseline)
+    print(f"{'':>6} {'conjugate':>10} {'baseline':>10} {'shift/sd':>9}")
+    for k in ["w", "b", "sigma"]:
+        for i, (m, q) in enumerate(zip(np.atleast_1d(posterior[k].mean(0)), np.atleast_1d(baseline[k].mean(0)))):
+            sd = np.atleast_1d(baseline[k].std(0))[i]
+            name = f"{k}[{i}]" if k == "w" else k
+            print(f"{name:>6} {m:>10.4f} {q:>10.4f} {(m - q) / sd:>+9.2f}")
+
+    X_test = pd.read_csv(DATA_DIR / "test_df.csv")[features].values
+    mean, std = bayesian_eval_batch(X_test, posterior)
+    base_mean, base_std = bayesian_eval_batch(X_test, baseline)
+    print(f"Test-set EV vs baseline: max |mean diff| {np.abs(mean - base_mean).max():.4f}, max |std diff| {np.abs(std - base_std).max():.4f}")
+
+    if args.stats is not None:
+        model.save(args.stats)
+        print(f"Saved statistics to: {args.stats}")
+
+    filename = f"unitddpm_ConjugateRegression_{datetime.now().strftime('%Y%m%d_%H%M%S')}_weights.npz"
+    np.savez(SAVE_DIR / filename, **posterior)
+    print(f"Saved weights to: {SAVE_DIR / filename}")
@@ -0,0 +1,189 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from geometry import add_geometry, end_geometry
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = PROJECT_ROOT / "data"
+SAVE_DIR = PROJECT_ROOT / "data_processing" / "processed_data"
+
+# Scripted version of data_processing.ipynb. Every step produces the same
+# frames as the notebook cells; the row-wise df.apply calls are replaced with
+# keys built once per distinct id combination, vectorized hammer / opponent
+# assignment and the array geometry in geometry.py, and Stones.csv is read
+# and keyed in chunks.
+
+GAME_KEY = ["CompetitionID", "SessionID", "GameID"]
+
+# a stone row recorded against the wrong team in the raw data
+TEAM_FIXES = {"24250026_18_1_9_18": 37}
+
+
+def uid(df, columns):
+    # "a_b_c" keys: factorize the integer id tuples, format each distinct tuple
+    # once and take by code, instead of an f-string per row
+    ids = df[columns].astype("int64")
+    codes = ids.groupby(columns, sort=False).ngroup().to_numpy()
+    parts = ids.drop_duplicates().astype(str)  # same first-seen order as the codes
+    labels = parts[columns[0]].str.cat([parts[c] for c in columns[1:]], sep="_")
+    return pd.Series(labels.to_numpy(dtype=object)[codes], index=df.index, dtype=object)
+
+def assign_hammer(shot_id):
+    # the hammer team throws the even shots
+    return pd.Series(np.where(shot_id % 2 != 0, 0, 1), index=shot_id.index)
+
+def opponent_id(ends):
+    own = ends["TeamID"]
+    opponent = np.where(own == ends["TeamID1"], ends["TeamID2"], np.where(own == ends["TeamID2"], ends["TeamID1"], np.nan))
+    opponent = pd.Series(opponent, index=ends.index)
+    if opponent.notna().all():
+        opponent = opponent.astype(np.result_type(ends["TeamID1"].dtype, ends["TeamID2"].dtype))
+    return opponent
+
+
+def load_games(path):
+    games = pd.read_csv(path)
+    games["GameUID"] = uid(games, GAME_KEY)
+    return games
+
+def load_ends(path):
+    ends = pd.read_csv(path)
+    ends["GameUID"] = uid(ends, GAME_KEY)
+    ends["TeamUID"] = uid(ends, GAME_KEY + ["TeamID"])
+    ends["EndUID"] = uid(ends, GAME_KEY + ["TeamID", "EndID"])
+    return ends
+
+def key_stones(stones):
+    stones["GameUID"] = uid(stones, GAME_KEY)
+    stones["EndUID"] = uid(stones, GAME_KEY + ["TeamID", "EndID"])
+    stones["ShotUID"] = uid(stones, GAME_KEY + ["EndID", "ShotID"])
+    for shot_uid, team_id in TEAM_FIXES.items():
+        stones.loc[stones["ShotUID"] == shot_uid, "TeamID"] = team_id
+    return stones
+
+def read_stones(path, chunksize = None):
+    # keys only depend on the row itself, so each chunk is keyed as it is read
+    if chunksize is None:
+        return key_stones(pd.read_csv(path))
+    chunks = [key_stones(chunk) for chunk in pd.read_csv(path, chunksize=chunksize)]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def process_ends(games, ends, stones):
+    ends.loc[ends["Result"] == 9, "Result"] = 0
+    ends["PowerPlay"] = ends["PowerPlay"].fillna(0)
+    ends["PowerPlayBool"] = ends["PowerPlay"].replace(2, 1)
+    ends = ends.sort_values(["GameUID", "TeamUID", "EndID"])
+    ends["CumulativeScore"] = ends.groupby("TeamUID")["Result"].cumsum()
+    ends = ends.merge(games[["GameUID","NOC1","NOC2","TeamID1","TeamID2","LSFE"]], on="GameUID", how="left").reset_index(drop = True)
+    stones = stones.merge(ends[["EndUID", "Result", "PowerPlay"]], on = "EndUID", how = "left").reset_index(drop = True)
+
+    stones["Has_Hammer"] = assign_hammer(stones["ShotID"])
+    hammer_per_end = (
+        stones.sort_values("ShotID")
+              .groupby("EndUID")
+              .tail(1)[["EndUID", "Has_Hammer"]]
+    )
+    ends = ends.merge(hammer_per_end, on="EndUID", how="left").drop_duplicates().reset_index(drop = True)
+
+    ends["OpponentID"] = opponent_id(ends)
+    ends["OpponentEndUID"] = uid(ends, GAME_KEY + ["OpponentID", "EndID"])
+
+    ends = ends.merge(
+        ends[["EndUID", "CumulativeScore"]].rename(columns={
+            "EndUID": "OpponentEndUID",
+            "CumulativeScore": "OpponentCumulative"
+        }),
+        on="OpponentEndUID",
+        how="left"
+    )
+    ends["ScoreDiff"] = ends["CumulativeScore"] - ends["OpponentCumulative"]
+    ends = ends.sort_values(["GameUID", "TeamID", "EndID"])
+    ends["PrevScoreDiff"] = (
+        ends.groupby(["GameUID", "TeamID"])["ScoreDiff"]
+            .shift(1)
+            .fillna(0)
+    )
+
+    ends = ends.merge(
+        ends[["EndUID", "Result"]].rename(columns={
+            "EndUID": "OpponentEndUID",
+            "Result": "OpponentResult"
+        }),
+        on="OpponentEndUID",
+        how="left"
+    )
+    ends["EndDiff"] = ends["Result"] - ends["OpponentResult"]
+    ends = ends.sort_values(["GameUID", "TeamID", "EndID"])
+    ends["PrevEndDiff"] = (
+        ends.groupby(["GameUID", "TeamID"])["EndDiff"]
+            .shift(1)
+            .fillna(0)
+    )
+
+    stones = add_geometry(stones)
+
+    tendency = (
+        ends[ends["PowerPlay"] != 0]  # remove 0 rows
+        .groupby("OpponentID")["PowerPlay"]
+        .value_counts(normalize=True)
+        .unstack()
+        .fillna(0)
+    )
+    tendency.columns = ["Tendency_PP_Right", "Tendency_PP_Left"]  # only 2 columns now
+    ends = ends.merge(tendency, on="OpponentID", how="left")
+    ends[["Tendency_PP_Right", "Tendency_PP_Left"]] = ends[["Tendency_PP_Right", "Tendency_PP_Left"]].fillna(0)
+
+    ends = ends.merge(end_geometry(stones), on="EndUID", how="left").fillna(0)
+    return ends, stones
+
+def bayesian_training(ends):
+    return ends[
+        ['EndUID', "Has_Hammer",
+                "PowerPlayBool",
+                "EndID",
+                "PrevScoreDiff", "PrevEndDiff", "Result"]
+        ]
+
+def run(data_dir = DATA_DIR, chunksize = None):
+    games = load_games(Path(data_dir) / "Games.csv")
+    ends = load_ends(Path(data_dir) / "Ends.csv")
+    stones = read_stones(Path(data_dir) / "Stones.csv", chunksize)
+    ends, stones = process_ends(games, ends, stones)
+    return {
+        "bayesian_training": bayesian_training(ends),
+        "ends_processed": ends,
+        "games_processed": games,
+        "stones_processed": stones
+    }
+
+def save(outputs, save_dir = SAVE_DIR):
+    for name, df in outputs.items():
+        df.to_csv(Path(save_dir) / f"{name}.csv", index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build processed_data/ from the raw Games, Ends and Stones CSVs")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--save-dir", type=Path, default=SAVE_DIR)
+    parser.add_argument("--chunksize", type=int, default=500000, help="Stones.csv rows per chunk (0 reads it whole)")
+    parser.add_argument("--check", action="store_true", help="compare with the CSVs already in --save-dir instead of overwriting them")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    outputs = run(args.data_dir, args.chunksize or None)
+    print(f"Processed {len(outputs['ends_processed'])} ends and {len(outputs['stones_processed'])} stones in {time.perf_counter() - start:.2f}s")
+
+    if args.check:
+        for name, df in outputs.items():
+            path = args.save_dir / f"{name}.csv"
+            if not path.exists():
+                print(f"{name}: no existing file to compare")
+                continue
+            same = df.to_csv(index=False) == path.read_text()
+            print(f"{name}: {'identical' if same else 'DIFFERENT'}")
+    else:
+        save(outputs, args.save_dir)
+        print(f"Saved processed data to: {args.save_dir}")
@@ -0,0 +1,170 @@
+import time
+import argparse
+from bisect import bisect_right
+import numpy as np
+from prob_table import ACTIONS, PROB_TABLE, PROB_TABLE_END_DIFF, ProbTable, cumulative, dense_probs
+
+_rng = np.random.default_rng()
+_buffer = []
+
+def seed(seed=None):
+    # reseed the generator used when no explicit rng is passed
+    global _rng
+    _rng = np.random.default_rng(seed)
+    _buffer.clear()
+
+def default_rng():
+    return _rng
+
+def get_state():
+    return {"bit_generator": _rng.bit_generator.state, "buffer": list(_buffer)}
+
+def set_state(state):
+    _rng.bit_generator.state = state["bit_generator"]
+    _buffer[:] = state["buffer"]
+
+def _uniform():
+    # scalar Generator.random() calls dominate single draws, so the default
+    # stream hands out uniforms from a refilled block instead
+    if not _buffer:
+        _buffer.extend(_rng.random(4096).tolist())
+        _buffer.reverse()
+    return _buffer.pop()
+
+
+def alias_table(probs):
+    # Vose's alias method
+    n = len(probs)
+    scaled = np.asarray(probs, dtype=float) * n / np.sum(probs)
+    prob = np.ones(n)
+    alias = np.arange(n)
+
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+
+    return prob, alias
+
+
+def cumulative_tables(prob_table = PROB_TABLE):
+    # dense (action, end, outcome) cumulative probabilities over hammer-relative results
+    if isinstance(prob_table, ProbTable):
+        return prob_table.outcomes, prob_table.cdf
+    outcomes, probs = dense_probs(prob_table)
+    return outcomes, cumulative(probs)
+
+
+class EndScoreSampler:
+    # Hammer-relative end results for every (action, end), built once from the
+    # probability table. Single draws use one uniform and an alias lookup;
+    # bulk draws do the same with NumPy arrays. A table built with score
+    # buckets also gets an alias table per (action, end, bucket) for draw_given.
+
+    def __init__(self, prob_table = PROB_TABLE):
+        self.outcomes, self.cdf = cumulative_tables(prob_table)
+        self.tables = {}
+        self.conditional = False
+        if not isinstance(prob_table, ProbTable):
+            for action, by_end in prob_table.items():
+                for end, dist in by_end.items():
+                    if dist:
+                        self.tables[action, end] = self.entry(list(dist.keys()), list(dist.values()))
+            return
+
+        # dense rows, so outcomes enter the alias tables in ascending order
+        cells = {}
+        for a, action in enumerate(ACTIONS):
+            for end in range(1, prob_table.probs.shape[1]):
+                cells[action, end] = prob_table.probs[a, end]
+                if prob_table.conditional:
+                    for bucket, probs in enumerate(prob_table.bucket_probs[a, end]):
+                        cells[action, end, bucket] = probs
+        if prob_table.conditional:
+            self.conditional = True
+            self.bucket_edges = prob_table.bucket_edges.tolist()
+        for key, probs in cells.items():
+            nonzero = np.flatnonzero(probs)
+            if len(nonzero):
+                self.tables[key] = self.entry(prob_table.outcomes[nonzero].tolist(), probs[nonzero])
+
+    @staticmethod
+    def entry(outcomes, probs):
+        prob, alias = alias_table(probs)
+        return list(outcomes), prob.tolist(), alias.tolist(), np.array(outcomes), prob, alias
+
+    def draw(self, action, end, rng=None):
+        outcomes, prob, alias, _, _, _ = self.tables[action, end]
+        u = (_uniform() if rng is None else rng.random()) * len(outcomes)
+        i = int(u)
+        return outcomes[i] if u - i < prob[i] else outcomes[alias[i]]
+
+    def draw_many(self, action, end, size, rng=None):
+        _, _, _, outcomes, prob, alias = self.tables[action, end]
+        u = (_rng if rng is None else rng).random(size) * len(outcomes)
+        i = u.astype(np.intp)
+        return outcomes[np.where(u - i < prob[i], i, alias[i])]
+
+    def draw_given(self, action, end, score_diff, rng=None):
+        # score_diff: the hammer team's lead before the end
+        if not self.conditional:
+            return self.draw(action, end, rng)
+        bucket = bisect_right(self.bucket_edges, score_diff)
+        outcomes, prob, alias, _, _, _ = self.tables[action, end, bucket]
+        u = (_uniform() if rng is None else rng.random()) * len(outcomes)
+        i = int(u)
+        return outcomes[i] if u - i < prob[i] else outcomes[alias[i]]
+
+
+END_SAMPLER = EndScoreSampler()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark: alias sampler against np.random.choice")
+    parser.add_argument("--draws", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    np.random.seed(args.seed)
+    action, end, n = "NO_PP", 5, args.draws
+    dist = PROB_TABLE_END_DIFF[action][end]
+
+    start = time.perf_counter()
+    for _ in range(n):
+        outcomes = list(dist.keys())
+        probs = np.array(list(dist.values()), dtype=float)
+        np.random.choice(outcomes, p=probs)
+    choice_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n):
+        END_SAMPLER.draw(action, end, rng)
+    draw_time = time.perf_counter() - start
+
+    seed(args.seed)
+    start = time.perf_counter()
+    for _ in range(n):
+        END_SAMPLER.draw(action, end)
+    stream_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk = END_SAMPLER.draw_many(action, end, n, rng)
+    bulk_time = time.perf_counter() - start
+
+    print(f"np.random.choice:  {choice_time / n * 1e9:8.0f} ns/draw")
+    print(f"sampler.draw(rng): {draw_time / n * 1e9:8.0f} ns/draw ({choice_time / draw_time:.1f}x)")
+    print(f"sampler.draw:      {stream_time / n * 1e9:8.0f} ns/draw ({choice_time / stream_time:.1f}x)")
+    print(f"sampler.draw_many: {bulk_time / n * 1e9:8.0f} ns/draw ({choice_time / bulk_time:.1f}x)")
+
+    values, counts = np.unique(bulk, return_counts=True)
+    err = max(abs(c / n - dist[v]) for v, c in zip(values.tolist(), counts))
+    print(f"max |empirical - table| probability over {n} bulk draws: {err:.4f}")
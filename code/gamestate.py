@@ -1,54 +1,140 @@
-import numpy as np
-from prob_table import PROB_TABLE_END_DIFF
-
-class GameState:
-    def __init__(self, current_score, end_number, root_team, hammer_team, powerplay_used, max_ends=8, powerplays_remaining = None, prev_end_diff=0):
-        self.current_score = current_score  # dict: {team1: score1, team2: score2}
-        self.end_number = end_number
-        self.root_team = root_team
-        self.hammer_team = hammer_team      # team_id that has hammer this end
-        self.powerplay_used = powerplay_used  # dict: {team1: bool, team2: bool}
-        self.max_ends = max_ends
-        self.prev_end_diff = prev_end_diff
+from operator import itemgetter
+from end_sampler import END_SAMPLER
 
+# Field layout of the state tuple. Teams are integer-coded 0/1 as positions in
+# (team_a, team_b); root and hammer hold those positions.
+TEAM_A, TEAM_B, ROOT, HAMMER, END, SCORE_A, SCORE_B, PP_A, PP_B, USED_A, USED_B, PREV_END_DIFF, MAX_ENDS = range(13)
+
+BOTH_ACTIONS = ("NO_PP", "PP")
+NO_PP_ONLY = ("NO_PP",)
+
+def _restore(fields):
+    return tuple.__new__(GameState, fields)
+
+class GameState(tuple):
+    # Immutable and hashable: equality and hashing come from the flat field
+    # tuple, so states can be used directly as cache and transposition keys.
+    __slots__ = ()
+
+    def __new__(cls, current_score, end_number, root_team, hammer_team, powerplay_used, max_ends=8, powerplays_remaining = None, prev_end_diff=0):
+        team_a, team_b = current_score  # dict: {team1: score1, team2: score2}
         if powerplays_remaining is None:
-            self.powerplays_remaining = {
-                t: 1 for t in current_score.keys()
-            }
-        else:
-            self.powerplays_remaining = powerplays_remaining
+            powerplays_remaining = {t: 1 for t in current_score}
+        return tuple.__new__(cls, (
+            team_a, team_b,
+            int(root_team != team_a),
+            int(hammer_team != team_a),  # team that has hammer this end
+            int(end_number),
+            int(current_score[team_a]), int(current_score[team_b]),
+            int(powerplays_remaining[team_a]), int(powerplays_remaining[team_b]),
+            bool(powerplay_used[team_a]), bool(powerplay_used[team_b]),
+            int(prev_end_diff),
+            int(max_ends)
+        ))
+
+    end_number = property(itemgetter(END))
+    max_ends = property(itemgetter(MAX_ENDS))
+    prev_end_diff = property(itemgetter(PREV_END_DIFF))
+
+    @property
+    def root_team(self):
+        return self[self[ROOT]]
+
+    @property
+    def hammer_team(self):
+        return self[self[HAMMER]]
+
+    @property
+    def hammer_lead(self):
+        h = self[HAMMER]
+        return self[SCORE_A + h] - self[SCORE_B - h]
+
+    @property
+    def current_score(self):
+        return {self[TEAM_A]: self[SCORE_A], self[TEAM_B]: self[SCORE_B]}
+
+    @property
+    def powerplays_remaining(self):
+        return {self[TEAM_A]: self[PP_A], self[TEAM_B]: self[PP_B]}
+
+    @property
+    def powerplay_used(self):
+        return {self[TEAM_A]: self[USED_A], self[TEAM_B]: self[USED_B]}
+
+    def __repr__(self):
+        return (
+            f"GameState(current_score={self.current_score}, end_number={self[END]}, "
+            f"root_team={self.root_team}, hammer_team={self.hammer_team}, "
+            f"powerplays_remaining={self.powerplays_remaining}, prev_end_diff={self[PREV_END_DIFF]})"
+        )
+
+    def __reduce__(self):
+        return (_restore, (tuple(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def is_terminal(self):
-        return self.end_number > self.max_ends 
+        return self[END] > self[MAX_ENDS]
 
     def legal_actions(self):
-        if self.powerplays_remaining[self.hammer_team] > 0 and self.end_number > 2:
-            return ["NO_PP", "PP"]
-        return ["NO_PP"]
+        if self[PP_A + self[HAMMER]] > 0 and self[END] > 2:
+            return BOTH_ACTIONS
+        return NO_PP_ONLY
 
     def features_for_ev(self, team, action = None):
-        opp = [t for t in self.current_score if t != team][0]
-        if team == self.root_team:
-            prev_end_diff_team = self.prev_end_diff
+        i = int(team != self[TEAM_A])
+        if i == self[ROOT]:
+            prev_end_diff_team = self[PREV_END_DIFF]
         else:
-            prev_end_diff_team = -self.prev_end_diff
+            prev_end_diff_team = -self[PREV_END_DIFF]
         return {
-            "HasHammer": int(team == self.hammer_team),
+            "HasHammer": int(i == self[HAMMER]),
             "PowerPlayBool": int(action == "PP") if action else 0,
-            "EndID": self.end_number,
-            "PrevScoreDiff": self.current_score[team] - self.current_score[opp],
+            "EndID": self[END],
+            "PrevScoreDiff": self[SCORE_A + i] - self[SCORE_B - i],
             "PrevEndDiff": prev_end_diff_team
         }
 
+    def key(self):
+        root = self[ROOT]
+        return (
+            self[END],
+            self[SCORE_A + root] - self[SCORE_B - root],
+            self[HAMMER] == root,
+            self[PP_A + root],
+            self[PP_B - root],
+            self[PREV_END_DIFF]
+        )
+
+    def same_position(self, other):
+        return (
+            self[END] == other[END]
+            and self.hammer_team == other.hammer_team
+            and self.current_score == other.current_score
+            and self.powerplays_remaining == other.powerplays_remaining
+        )
+
+    def with_root(self, root_team):
+        if root_team == self.root_team:
+            return self
+        fields = list(self)
+        fields[ROOT] = 1 - self[ROOT]
+        fields[PREV_END_DIFF] = -self[PREV_END_DIFF]
+        return tuple.__new__(GameState, fields)
+
+    def sample_end_result(self, action, rng=None):
+        if END_SAMPLER.conditional:
+            return END_SAMPLER.draw_given(action, self[END], self.hammer_lead, rng)
+        return END_SAMPLER.draw(action, self[END], rng)
+
     def sample_end_score(self, action):
         hammer = self.hammer_team
-        no_hammer = [t for t in self.current_score if t != hammer][0]
-        end = self.end_number
-        dist = PROB_TABLE_END_DIFF[action][end]
-
-        outcomes = list(dist.keys())
-        probs = np.array(list(dist.values()), dtype=float)
-        result = np.random.choice(outcomes, p=probs)
+        no_hammer = self[1 - self[HAMMER]]
+        result = self.sample_end_result(action)
 
         if result > 0:
             return {hammer: result, no_hammer: 0}
@@ -58,42 +144,36 @@ class GameState:
             return {hammer: 0, no_hammer: 0}
 
     def next_state(self, action):
-        hammer = self.hammer_team
-        no_hammer = [t for t in self.current_score if t != hammer][0]
-        root = self.root_team
-        opp = [t for t in self.current_score if t != root][0]
+        return self.transition(action, self.sample_end_result(action))
 
-        score_delta = self.sample_end_score(action)
+    def transition(self, action, result):
+        team_a, team_b, root, hammer, end, score_a, score_b, pp_a, pp_b, used_a, used_b, _, max_ends = self
 
-        new_score = self.current_score.copy()
-        for t in new_score:
-            new_score[t] += score_delta[t]
+        # result is hammer-relative: > 0 the hammer team scores, < 0 the other team steals
+        a_scores = (hammer == 0) == (result > 0)
+        points = result if result > 0 else -result
+        if a_scores:
+            score_a += points
+        else:
+            score_b += points
 
-        end_diff = score_delta[root] - score_delta[opp]
+        end_diff = points if (root == 0) == a_scores else -points
+        if not points:
+            end_diff = 0
 
-        if score_delta[hammer] > 0:
-            next_hammer = no_hammer
-        elif score_delta[no_hammer] > 0:
-            next_hammer = hammer
-        else:
-            next_hammer = no_hammer
-        
-        new_pp_used = self.powerplay_used.copy()
-        new_pp_remaining = self.powerplays_remaining.copy()
-
-        if action in ["PP"]:
-            new_pp_used[hammer] = True
-            new_pp_remaining[hammer] -= 1
-
-        return GameState(
-            current_score=new_score,
-            end_number=self.end_number + 1,
-            root_team=self.root_team,       
-            hammer_team=next_hammer,       
-            powerplay_used=new_pp_used,
-            powerplays_remaining = new_pp_remaining,
-            max_ends=self.max_ends,
-            prev_end_diff=end_diff
-        )
-    
-    
+        if action == "PP":
+            if hammer == 0:
+                used_a = True
+                pp_a -= 1
+            else:
+                used_b = True
+                pp_b -= 1
+
+        # the team that scores gives up the hammer; a blank end passes it too
+        next_hammer = hammer if result < 0 else 1 - hammer
+
+        return tuple.__new__(GameState, (
+            team_a, team_b, root, next_hammer, end + 1,
+            score_a, score_b, pp_a, pp_b, used_a, used_b,
+            end_diff, max_ends
+        ))
@@ -0,0 +1,147 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+STONES = range(1, 13)
+X_COLUMNS = [f"stone_{i}_x" for i in STONES]
+Y_COLUMNS = [f"stone_{i}_y" for i in STONES]
+FEATURES = ["BurialDepth", "GuardAngle", "ClusterIndex", "SideOpenness"]
+
+CENTER_X, CENTER_Y = 750, 800
+HOUSE_X, HOUSE_Y = 1500, 3000
+CLUSTER_RADIUS = 300
+
+
+def compute_geometry(board_x, board_y):
+    # row-wise reference from data_processing.ipynb; geometry_features must match it exactly
+    import torch
+
+    house = [(x,y) for x,y in zip(board_x,board_y) if 0 < x < 1500 and 0 < y < 3000] # no 0 or 4095
+    if not house:
+        return 0,0,0,0
+
+    # Burial depth: how close a house stone is to center
+    cx, cy = 750, 800
+    burial = min(((x-cx)**2 + (y-cy)**2)**0.5 for x,y in house)
+
+    # Guard cover angle: angle between closest stone and center
+    gx, gy = house[0]
+    angle = torch.atan2(torch.tensor(gy-cy), torch.tensor(gx-cx)).item()
+
+    # Clustering: how tight stones are packed
+    cluster = sum(((x-cx)**2 + (y-cy)**2)**0.5 < 300 for x,y in house) / len(house)
+
+    # Side openness: difference between left and right free space
+    left_open = sum(x < cx for x,_ in house)
+    right_open = sum(x > cx for x,_ in house)
+    openness = right_open - left_open
+
+    return burial, angle, cluster, openness
+
+
+def distances(d2):
+    # Python's float ** 0.5 goes through libm pow, which is not always the
+    # correctly rounded sqrt NumPy computes, so evaluate it once per distinct
+    # squared distance and scatter the results back
+    unique, inverse = np.unique(d2, return_inverse=True)
+    return np.fromiter((v ** 0.5 for v in unique.tolist()), dtype=np.float64, count=len(unique))[inverse]
+
+def angles(dy, dx):
+    # float32 atan2, as torch.atan2 gave on the notebook's 0-dim tensors.
+    # Contiguous inputs take torch's vectorized kernel, which can differ in the
+    # last bit; columns of an (n, 2) tensor are strided and run the scalar one.
+    import torch
+
+    pairs = torch.from_numpy(np.stack([dy, dx], axis=1).astype(np.float32))
+    return torch.atan2(pairs[:, 0], pairs[:, 1]).numpy().astype(np.float64)
+
+def geometry_features(x, y):
+    # (n, 12) board coordinates -> n rows of (burial, angle, cluster, openness)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+
+    house = (0 < x) & (x < HOUSE_X) & (0 < y) & (y < HOUSE_Y)  # no 0 or 4095
+    in_house = house.sum(axis=1)
+    occupied = in_house > 0
+
+    dx = x - CENTER_X
+    dy = y - CENTER_Y
+    dist = np.full(x.shape, np.inf)
+    dist[house] = distances(dx[house] ** 2 + dy[house] ** 2)
+
+    burial = np.where(occupied, dist.min(axis=1), 0.0)
+
+    first = house.argmax(axis=1)  # first stone in the house, in stone order
+    angle = np.zeros(n)
+    rows = np.flatnonzero(occupied)
+    angle[rows] = angles(dy[rows, first[rows]], dx[rows, first[rows]])
+
+    cluster = np.zeros(n)
+    np.divide((dist < CLUSTER_RADIUS).sum(axis=1), in_house, out=cluster, where=occupied)
+
+    openness = (house & (dx > 0)).sum(axis=1) - (house & (dx < 0)).sum(axis=1)
+
+    if not occupied.any():
+        # the notebook's all-integer (0, 0, 0, 0) tuples
+        return burial.astype(np.int64), angle.astype(np.int64), cluster.astype(np.int64), openness
+    return burial, angle, cluster, openness
+
+def add_geometry(stones):
+    values = geometry_features(stones[X_COLUMNS].to_numpy(), stones[Y_COLUMNS].to_numpy())
+    for name, column in zip(FEATURES, values):
+        stones[name] = column
+    return stones
+
+def end_geometry(stones):
+    # per-end means; pandas' grouped mean keeps the notebook's summation
+    return stones.groupby("EndUID")[FEATURES].mean()
+
+
+def add_geometry_rowwise(stones):
+    stones["BurialDepth"], stones["GuardAngle"], stones["ClusterIndex"], stones["SideOpenness"] = zip(
+        *stones.apply(lambda r: compute_geometry(
+            [r[f"stone_{i}_x"] for i in range(1,13)],
+            [r[f"stone_{i}_y"] for i in range(1,13)]
+        ), axis=1)
+    )
+    return stones
+
+def random_stones(n, rng):
+    # board positions with the raw data's 0 / 4095 "not in play" markers
+    def coords(high):
+        kind = rng.random((n, 12))
+        return np.where(kind < 0.3, 0, np.where(kind < 0.4, 4095, rng.integers(1, high, (n, 12))))
+    df = pd.DataFrame(np.hstack([coords(1600), coords(3100)]), columns=X_COLUMNS + Y_COLUMNS)
+    df["EndUID"] = (np.arange(n) // 5).astype(str)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and time the vectorized stone geometry against the row-wise notebook version")
+    parser.add_argument("--stones", type=int, default=1000000, help="stone records for the vectorized timing")
+    parser.add_argument("--check", type=int, default=20000, help="stone records compared with the row-wise version")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    sample = random_stones(args.check, rng)
+    start = time.perf_counter()
+    rowwise = add_geometry_rowwise(sample.copy())
+    rowwise_time = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized = add_geometry(sample.copy())
+    vector_time = time.perf_counter() - start
+
+    same_rows = rowwise[FEATURES].equals(vectorized[FEATURES])
+    same_ends = end_geometry(rowwise).equals(end_geometry(vectorized))
+    print(f"{args.check} stones: row-wise {rowwise_time:.2f}s, vectorized {vector_time:.3f}s ({rowwise_time / vector_time:.0f}x)")
+    print(f"per-stone features identical: {same_rows}, per-end means identical: {same_ends}")
+
+    stones = random_stones(args.stones, rng)
+    start = time.perf_counter()
+    add_geometry(stones)
+    ends = end_geometry(stones)
+    print(f"{args.stones} stones / {len(ends)} ends: vectorized features and end means in {time.perf_counter() - start:.2f}s")
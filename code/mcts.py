@@ -1,7 +1,164 @@
 import math
+import time
 import random
+import argparse
+import end_sampler
 import numpy as np
-from copy import deepcopy
+from pathlib import Path
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SCALING_PATH = PROJECT_ROOT / "figures" / "analysis" / "simulation_statistics" / "root_parallel_scaling.csv"
+
+def win_prob(ev, ends_left):
+    ends_left = max(ends_left, 1)
+    sigma = 1.5 / np.sqrt(ends_left)
+    return 1 / (1 + np.exp(-ev / sigma))
+
+def leaf_value(state, ev_model, root, opp):
+    # Direct estimate of what a rollout from state would add: one win_prob
+    # term per remaining end, all using the EV difference at state
+    ev_root, _ = ev_model(state.features_for_ev(root))
+    ev_opp, _ = ev_model(state.features_for_ev(opp))
+    ev_diff = ev_root - ev_opp
+    return sum(win_prob(ev_diff, ends_left) for ends_left in range(state.max_ends - state.end_number + 1))
+
+def simulate(state, ev_model, rollouts=1, engine=None, depth=None):
+    # random-policy rollout from state: the root team's summed per-end win
+    # probabilities. With depth, only that many ends are played and leaf_value
+    # scores the rest (depth=0 skips the rollout). Rollout engines ignore depth.
+    if engine is not None:
+        return float(engine.rollout(state, rollouts).mean())
+    if rollouts > 1 and depth != 0:
+        return sum(simulate(state, ev_model, depth=depth) for _ in range(rollouts)) / rollouts
+
+    root = state.root_team
+    opp = [t for t in state.current_score if t != root][0]
+    total_reward = 0
+    played = 0
+    while not state.is_terminal():
+        if played == depth:
+            return total_reward + leaf_value(state, ev_model, root, opp)
+        played += 1
+        action = random.choice(state.legal_actions())
+        state = state.next_state(action)
+
+        ev_root, _ = ev_model(state.features_for_ev(root))
+        ev_opp, _ = ev_model(state.features_for_ev(opp))
+        ev_diff = ev_root - ev_opp
+        ends_left = state.max_ends - state.end_number + 1
+        p = win_prob(ev_diff, ends_left)
+        total_reward += p
+    return total_reward
+
+class SearchStats:
+    # Result of one MCTS.search. Unpacks and indexes like the (action, value)
+    # pair search used to return, so `action, value = mcts.search(state)` works.
+    # Times are seconds and only filled in by MCTS(..., profile=True), since
+    # the clock calls cost more than a short simulation; "rollout" excludes the EV calls made inside rollouts,
+    # which are timed under "ev". Rollout engines evaluate EV in batches of
+    # their own, so with an engine ev_calls stays 0 and EV time counts as rollout.
+
+    PHASES = ("selection", "expansion", "rollout", "ev", "backprop")
+
+    def __init__(self):
+        self.action = None
+        self.value = None
+        self.children = {}  # action -> {"visits": n, "mean_reward": r}
+        self.simulations = 0
+        self.reused_simulations = 0
+        self.stop_reason = None  # "budget", "single_action", "confidence", "exhausted" or "time"
+        self.tree_size = 0
+        self.max_depth = 0
+        self.rollouts = 0
+        self.ev_calls = 0
+        self.time = {phase: 0.0 for phase in self.PHASES}
+        self.wall_time = 0.0
+        # count, sum and sum of squares of the rewards backed up through each
+        # root child during this search, for the early-stopping interval
+        self.root_rewards = {}
+
+    def __iter__(self):
+        return iter((self.action, self.value))
+
+    def __getitem__(self, i):
+        return (self.action, self.value)[i]
+
+    def merge(self, other):
+        # combine counters from independent trees; times add up across workers
+        self.simulations += other.simulations
+        self.reused_simulations += other.reused_simulations
+        self.tree_size += other.tree_size
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.rollouts += other.rollouts
+        self.ev_calls += other.ev_calls
+        for phase in self.PHASES:
+            self.time[phase] += other.time[phase]
+        self.stop_reason = self.stop_reason or other.stop_reason
+        return self
+
+    def record_reward(self, action, reward):
+        n, total, total_sq = self.root_rewards.get(action, (0, 0.0, 0.0))
+        self.root_rewards[action] = (n + 1, total + reward, total_sq + reward * reward)
+
+    def min_samples(self):
+        return min((n for n, _, _ in self.root_rewards.values()), default=0)
+
+    def separated(self, z, min_visits):
+        # True when the z-level intervals on the two root actions' mean rewards
+        # no longer overlap: |mean_a - mean_b| > z * (se_a + se_b)
+        if len(self.root_rewards) != 2 or self.min_samples() < min_visits:
+            return False
+        (n_a, s_a, q_a), (n_b, s_b, q_b) = self.root_rewards.values()
+        mean_a, mean_b = s_a / n_a, s_b / n_b
+        var_a = max(q_a / n_a - mean_a * mean_a, 0.0) * n_a / (n_a - 1)
+        var_b = max(q_b / n_b - mean_b * mean_b, 0.0) * n_b / (n_b - 1)
+        return abs(mean_a - mean_b) > z * (math.sqrt(var_a / n_a) + math.sqrt(var_b / n_b))
+
+    def record_tree(self, root_node):
+        stack = [(root_node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            self.tree_size += 1
+            self.max_depth = max(self.max_depth, depth)
+            stack.extend((child, depth + 1) for child in node.children)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class CountedEV:
+    # wraps an EV model to count calls
+    def __init__(self, ev_model):
+        self.ev_model = ev_model
+        self.calls = 0
+
+    def __call__(self, features):
+        self.calls += 1
+        return self.ev_model(features)
+
+
+class TimedEV:
+    # wraps an EV model to count calls and the time spent in them
+    def __init__(self, ev_model):
+        self.ev_model = ev_model
+        self.calls = 0
+        self.time = 0.0
+
+    def __call__(self, features):
+        start = time.perf_counter()
+        value = self.ev_model(features)
+        self.time += time.perf_counter() - start
+        self.calls += 1
+        return value
+
+
+def log_search(stats):
+    # callback reproducing the per-child lines search used to print
+    for action, child in stats.children.items():
+        print(action, "visits:", child["visits"], "avg reward:", child["mean_reward"])
+
 
 class MCTSNode:
     def __init__(self, state, parent=None, action_taken=None):
@@ -10,6 +167,7 @@ class MCTSNode:
         self.children = []
         self.visits = 0
         self.total_reward = 0.0
+        self.total_steps = 0  # number of per-end rewards summed into total_reward
         self.action_taken = action_taken  
         self._legal_actions = state.legal_actions()
 
@@ -46,59 +204,351 @@ class MCTSNode:
         return child_node
     
     def win_prob(self, ev, ends_left):
-        ends_left = max(ends_left, 1)
-        sigma = 1.5 / np.sqrt(ends_left)
-        return 1 / (1 + np.exp(-ev / sigma))
-
-    def simulate(self, ev_model):
-        state = deepcopy(self.state)
-        total_reward = 0
-        while not state.is_terminal():
-            action = random.choice(state.legal_actions())
-            state = state.next_state(action)
-        
-            root = self.state.root_team
-            opp = [t for t in state.current_score if t != root][0]
-
-            ev_root, _ = ev_model(state.features_for_ev(root))
-            ev_opp, _ = ev_model(state.features_for_ev(opp))
-            ev_diff = ev_root - ev_opp
-            ends_left = state.max_ends - state.end_number + 1
-            p = self.win_prob(ev_diff, ends_left)
-            total_reward += p
-        return total_reward
+        return win_prob(ev, ends_left)
+
+    def simulate(self, ev_model, rollouts=1, engine=None, depth=None):
+        return simulate(self.state, ev_model, rollouts, engine, depth)
     
-    def backpropagate(self, reward):
+    def backpropagate(self, reward, steps=0):
         self.visits += 1
         self.total_reward += reward
+        self.total_steps += steps
         if self.parent:
-            self.parent.backpropagate(reward)
+            self.parent.backpropagate(reward, steps)
+
+    def reroot(self, root_team):
+        # win_prob(-x) == 1 - win_prob(x), so the other team's reward for a
+        # rollout is its number of per-end terms minus the root team's reward
+        if root_team != self.state.root_team:
+            self.total_reward = self.total_steps - self.total_reward
+        self.state = self.state.with_root(root_team)
+        for child in self.children:
+            child.reroot(root_team)
+
+    def promote(self, state):
+        for child in self.children:
+            if child.state.same_position(state):
+                child.parent = None
+                child.action_taken = None
+                child.reroot(state.root_team)
+                child.state = state
+                return child
+        return None
+
+def exhausted(root_node):
+    # True when every non-terminal node has all its children: each action keeps
+    # the one outcome it sampled on expansion, so from here on every simulation
+    # ends on a terminal leaf with reward 0 and adds no information
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if node.state.is_terminal():
+            continue
+        if not node.is_fully_expanded():
+            return False
+        stack.extend(node.children)
+    return True
+
+def root_statistics(ev_model, root_state, num_simulations, seed_seq, rollouts_per_leaf=1, rollout_engine=None, profile=False, options=None, mcts_class=None):
+    # one independent root-parallel tree, seeded from its own SeedSequence
+    random.seed(int(seed_seq.generate_state(1)[0]))
+    np.random.seed(seed_seq.generate_state(4))
+    end_sampler.seed(seed_seq)
+
+    mcts = (mcts_class or MCTS)(ev_model, num_simulations, rollouts_per_leaf=rollouts_per_leaf, rollout_engine=rollout_engine, profile=profile, **(options or {}))
+    root = mcts.new_root(root_state)
+    stats = mcts.run(root, num_simulations, SearchStats())
+    mcts.record_tree(stats, root)
+    return mcts.root_children(root), stats
 
 class MCTS:
-    def __init__(self, ev_model, num_simulations):
+    def __init__(self, ev_model, num_simulations, reuse_tree=False, workers=1, seed=None, rollouts_per_leaf=1, rollout_engine=None, callback=None, profile=False,
+                 time_budget=None, early_stop=False, confidence=0.99, min_visits=50, check_every=50, leaf_depth=None):
+        if reuse_tree and workers > 1:
+            raise ValueError("reuse_tree is not supported with root-parallel search (workers > 1)")
         self.ev_model = ev_model
         self.num_simulations = num_simulations
+        self.reuse_tree = reuse_tree
+        self.workers = workers
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_engine = rollout_engine  # e.g. rollout.VectorRollout(bayesian_eval_batch)
+        self.leaf_depth = leaf_depth  # ends played per rollout before leaf_value scores the rest; None plays to the end
+        self.seed_seq = np.random.SeedSequence(seed)
+        self.callback = callback  # called with the SearchStats of every search, e.g. log_search
+        self.profile = profile  # time the selection / expansion / rollout / EV / backprop phases
+        # anytime search: num_simulations becomes a cap. Every check_every
+        # simulations the search stops once time_budget seconds have passed or,
+        # with early_stop, once both root actions have min_visits samples and
+        # their confidence intervals separate, or once the tree is exhausted.
+        self.time_budget = time_budget
+        self.early_stop = early_stop
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.min_visits = min_visits
+        self.check_every = check_every
+        self.root = None
+        self.reused_simulations = 0
+        self._pool = None
+
+    # Tree hooks: search, run and the root-parallel workers only touch the tree
+    # through these, so other tree layouts (array_mcts.ArrayMCTS) can reuse them.
+
+    def new_root(self, root_state):
+        return MCTSNode(root_state)
+
+    def root_children(self, root_node):
+        return {c.action_taken: (c.visits, c.total_reward) for c in root_node.children}
+
+    def record_tree(self, stats, root_node):
+        stats.record_tree(root_node)
 
-    def search(self, root_state):
-        root_node = MCTSNode(root_state)
+    def is_exhausted(self, root_node):
+        return exhausted(root_node)
 
-        for _ in range(self.num_simulations):
+    def legal_count(self, root_node):
+        return len(root_node._legal_actions)
+
+    def root_visits(self, root_node):
+        return root_node.visits
+
+    def run(self, root_node, num_simulations, stats):
+        stats.stop_reason = "budget"
+        if self.legal_count(root_node) == 1:
+            # nothing to decide
+            stats.stop_reason = "single_action"
+            return stats
+        if self.time_budget is None and not self.early_stop:
+            return self.grow(root_node, num_simulations, stats)
+
+        deadline = math.inf if self.time_budget is None else time.perf_counter() + self.time_budget
+        done = 0
+        while done < num_simulations:
+            batch = min(self.check_every, num_simulations - done)
+            self.grow(root_node, batch, stats)
+            done += batch
+            if self.early_stop and stats.separated(self.z, self.min_visits):
+                stats.stop_reason = "confidence"
+                break
+            if self.early_stop and stats.min_samples() >= self.min_visits and self.is_exhausted(root_node):
+                stats.stop_reason = "exhausted"
+                break
+            if time.perf_counter() >= deadline:
+                stats.stop_reason = "time"
+                break
+        return stats
+
+    def leaf_rollouts(self, state):
+        # rollouts simulate() plays from state: none from a terminal state, or
+        # when leaf_depth=0 scores the leaf with leaf_value (engines ignore depth)
+        if state.is_terminal() or (self.leaf_depth == 0 and self.rollout_engine is None):
+            return 0
+        return self.rollouts_per_leaf
+
+    def grow(self, root_node, num_simulations, stats=None):
+        stats = SearchStats() if stats is None else stats
+        if self.profile:
+            return self.grow_profiled(root_node, num_simulations, stats)
+
+        ev_model = CountedEV(self.ev_model)
+        rollouts = 0
+        for _ in range(num_simulations):
             node = root_node
+            first = None  # root child this simulation went through
 
             while node.is_fully_expanded() and node.children:
                 node = node.best_child()
+                first = first or node
             
             if not node.state.is_terminal():
                 node = node.expand() or node
+                first = first or node
+
+            rollouts += self.leaf_rollouts(node.state)
+            reward = node.simulate(ev_model, self.rollouts_per_leaf, self.rollout_engine, self.leaf_depth)
+            steps = max(node.state.max_ends - node.state.end_number + 1, 0)
+            node.backpropagate(reward, steps)
+            if first is not None:
+                stats.record_reward(first.action_taken, reward)
+
+        stats.simulations += num_simulations
+        stats.rollouts += rollouts
+        stats.ev_calls += ev_model.calls
+        return stats
+
+    def grow_profiled(self, root_node, num_simulations, stats):
+        # same loop as grow, with every phase timed
+        ev_model = TimedEV(self.ev_model)
+        clock = time.perf_counter
+        selection = expansion = rollout = backprop = 0.0
+
+        for _ in range(num_simulations):
+            t0 = clock()
+            node = root_node
+            first = None
+
+            while node.is_fully_expanded() and node.children:
+                node = node.best_child()
+                first = first or node
+            t1 = clock()
+
+            if not node.state.is_terminal():
+                node = node.expand() or node
+                first = first or node
+            stats.rollouts += self.leaf_rollouts(node.state)
+            t2 = clock()
+
+            reward = node.simulate(ev_model, self.rollouts_per_leaf, self.rollout_engine, self.leaf_depth)
+            t3 = clock()
+
+            steps = max(node.state.max_ends - node.state.end_number + 1, 0)
+            node.backpropagate(reward, steps)
+            if first is not None:
+                stats.record_reward(first.action_taken, reward)
+            t4 = clock()
+
+            selection += t1 - t0
+            expansion += t2 - t1
+            rollout += t3 - t2
+            backprop += t4 - t3
+
+        stats.simulations += num_simulations
+        stats.ev_calls += ev_model.calls
+        stats.time["selection"] += selection
+        stats.time["expansion"] += expansion
+        stats.time["rollout"] += rollout - ev_model.time
+        stats.time["ev"] += ev_model.time
+        stats.time["backprop"] += backprop
+        return stats
+
+    def search(self, root_state, previous_tree=None):
+        if self.workers > 1:
+            return self.search_parallel(root_state)
+
+        if previous_tree is None and self.reuse_tree:
+            previous_tree = self.root
+
+        root_node = None
+        if previous_tree is not None:
+            root_node = previous_tree.promote(root_state)
+        if root_node is None:
+            root_node = self.new_root(root_state)
+        self.root = root_node
+
+        start = time.perf_counter()
+        stats = SearchStats()
+        visits = self.root_visits(root_node)
+        stats.reused_simulations = min(visits, self.num_simulations)
+        self.reused_simulations += stats.reused_simulations
+
+        self.run(root_node, self.num_simulations - visits, stats)
+        self.record_tree(stats, root_node)
+        return self.finish(stats, self.root_children(root_node), start, root_state)
+
+    def finish(self, stats, merged, start, root_state):
+        stats.children = {
+            action: {"visits": visits, "mean_reward": total_reward / (visits + 1e-6)}
+            for action, (visits, total_reward) in merged.items()
+        }
+        merged = {a: merged[a] for a in merged if merged[a][0] > 0}
+        if merged:
+            best = max(merged, key=lambda a: merged[a][1] / max(1, merged[a][0]))
+            stats.action = best
+            stats.value = merged[best][1] / merged[best][0]
+        else:
+            # single legal action searched with no simulations: no value estimate
+            stats.action = root_state.legal_actions()[0]
+        stats.wall_time = time.perf_counter() - start
+
+        if self.callback is not None:
+            self.callback(stats)
+        return stats
+
+    def search_parallel(self, root_state):
+        start = time.perf_counter()
+        if len(root_state.legal_actions()) == 1:
+            stats = SearchStats()
+            stats.stop_reason = "single_action"
+            return self.finish(stats, {}, start, root_state)
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        sizes = [self.num_simulations // self.workers + (i < self.num_simulations % self.workers) for i in range(self.workers)]
+        seed_seqs = self.seed_seq.spawn(self.workers)
+        n = self.workers
+        # each worker applies the time budget and stopping rule to its own tree
+        options = {
+            "time_budget": self.time_budget,
+            "early_stop": self.early_stop,
+            "confidence": self.confidence,
+            "min_visits": self.min_visits,
+            "check_every": self.check_every,
+            "leaf_depth": self.leaf_depth
+        }
+        trees = self._pool.map(
+            root_statistics,
+            [self.ev_model] * n, [root_state] * n, sizes, seed_seqs,
+            [self.rollouts_per_leaf] * n, [self.rollout_engine] * n, [self.profile] * n, [options] * n, [type(self)] * n
+        )
+
+        merged = {}
+        stats = SearchStats()
+        for tree, tree_stats in trees:
+            stats.merge(tree_stats)
+            for action, (visits, total_reward) in tree.items():
+                v, r = merged.get(action, (0, 0.0))
+                merged[action] = (v + visits, r + total_reward)
+
+        return self.finish(stats, merged, start, root_state)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def scaling_curve(ev_model, root_state, num_simulations, worker_counts, repeats=3):
+    rows = []
+    for workers in worker_counts:
+        mcts = MCTS(ev_model, num_simulations, workers=workers, seed=0)
+        mcts.search(root_state)  # warm up the pool
+        start = time.perf_counter()
+        for _ in range(repeats):
+            mcts.search(root_state)
+        elapsed = time.perf_counter() - start
+        mcts.close()
+        rows.append((workers, repeats * num_simulations / elapsed))
+    return rows
+
+
+if __name__ == "__main__":
+    from gamestate import GameState
+    from bayesian_ev import bayesian_eval_continuous
+
+    parser = argparse.ArgumentParser(description="Root-parallel MCTS scaling: simulations per second against worker count")
+    parser.add_argument("--simulations", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--out", type=Path, default=SCALING_PATH)
+    args = parser.parse_args()
+
+    state = GameState(
+        current_score = {1: 0, 2: 0},
+        end_number = 3,
+        root_team = 1,
+        hammer_team = 1,
+        powerplay_used = {1: False, 2: False}
+    )
+    rows = scaling_curve(bayesian_eval_continuous, state, args.simulations, args.workers, args.repeats)
+
+    base = rows[0][1]
+    print(f"{'workers':>8} {'sims/s':>10} {'speedup':>8}")
+    for workers, rate in rows:
+        print(f"{workers:>8} {rate:>10.0f} {rate / base:>8.2f}")
 
-            reward = node.simulate(self.ev_model)
-            node.backpropagate(reward)
-        
-        for c in root_node.children:
-            print(c.action_taken, "visits:", c.visits, "avg reward:", c.total_reward / (c.visits + 1e-6))
-
-        best = max(root_node.children, key=lambda c: c.total_reward / max(1, c.visits))
-        
-        return best.action_taken, best.total_reward / best.visits
-        
-       
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w") as f:
+        f.write("workers,simulations_per_second,speedup\n")
+        for workers, rate in rows:
+            f.write(f"{workers},{rate},{rate / base}\n")
+    print(f"Saved scaling curve to: {args.out}")
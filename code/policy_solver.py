@@ -0,0 +1,213 @@
+import os
+import time
+import argparse
+import end_sampler
+import numpy as np
+from pathlib import Path
+from gamestate import GameState
+from prob_table import PROB_TABLE, ProbTable, dense_probs
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+TABLE_PATH = PROJECT_ROOT / "weights" / "policy_table.npz"
+
+ACTIONS = ["NO_PP", "PP"]
+
+# States are seen from the team holding the hammer, which is the team that
+# decides on the power play: (end, hammer score - other score,
+# powerplays remaining for hammer, powerplays remaining for other).
+# win/draw are that team's probabilities under optimal play by both teams.
+# table_key is the fingerprint of the probability table the policy was
+# solved on, so load_policy can tell when the cached file is stale.
+
+class PolicyTable:
+    def __init__(self, action, win, draw, max_ends, max_powerplays, draw_value, table_key = ""):
+        self.action = action
+        self.win = win
+        self.draw = draw
+        self.max_ends = max_ends
+        self.max_powerplays = max_powerplays
+        self.draw_value = draw_value
+        self.table_key = table_key
+        self.offset = (win.shape[1] - 1) // 2
+
+    def index(self, state):
+        hammer = state.hammer_team
+        other = [t for t in state.current_score if t != hammer][0]
+        diff = state.current_score[hammer] - state.current_score[other]
+        diff = min(max(diff, -self.offset), self.offset)
+        return (
+            state.end_number,
+            diff + self.offset,
+            state.powerplays_remaining[hammer],
+            state.powerplays_remaining[other]
+        )
+
+    def lookup(self, state):
+        idx = self.index(state)
+        value = self.win[idx] + self.draw_value * self.draw[idx]
+        return ACTIONS[self.action[idx]], float(value)
+
+    def search(self, state):
+        return self.lookup(state)
+
+    @property
+    def nbytes(self):
+        return self.action.nbytes + self.win.nbytes + self.draw.nbytes
+
+    def save(self, path = TABLE_PATH):
+        # write to a temporary file and rename, so a reader never sees a partial table
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(
+                f,
+                action=self.action,
+                win=self.win,
+                draw=self.draw,
+                meta=np.array([self.max_ends, self.max_powerplays, self.draw_value]),
+                table_key=np.array(self.table_key)
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path = TABLE_PATH):
+        with np.load(path) as data:
+            max_ends, max_powerplays, draw_value = data["meta"]
+            table_key = str(data["table_key"]) if "table_key" in data.files else ""
+            return cls(data["action"], data["win"], data["draw"], int(max_ends), int(max_powerplays), float(draw_value), table_key)
+
+
+def solve(prob_table = PROB_TABLE, max_ends = 8, max_powerplays = 1, draw_value = 0.5):
+    # prob_table: a ProbTable, or a {action: {end: {result: p}}} dict
+    if isinstance(prob_table, ProbTable):
+        outcomes, probs, table_key = prob_table.outcomes, prob_table.probs, prob_table.fingerprint
+    else:
+        (outcomes, probs), table_key = dense_probs(prob_table), ""
+    max_points = int(np.abs(outcomes[probs.any(axis=(0, 1))]).max())
+    offset = max_points * max_ends
+    diffs = np.arange(-offset, offset + 1)
+    pp = max_powerplays + 1
+
+    # (action, end, diff, outcome) probabilities; with score buckets each diff
+    # gets its own bucket's distribution
+    if isinstance(prob_table, ProbTable) and prob_table.conditional:
+        buckets = np.searchsorted(prob_table.bucket_edges, diffs, side="right")
+        probs = prob_table.bucket_probs[:, :, buckets]
+    else:
+        probs = np.broadcast_to(probs[:, :, None], (probs.shape[0], probs.shape[1], len(diffs), probs.shape[2]))
+
+    win = np.zeros((max_ends + 2, len(diffs), pp, pp))
+    draw = np.zeros_like(win)
+    action = np.zeros(win.shape, dtype=np.int8)
+
+    win[max_ends + 1] = (diffs > 0)[:, None, None]
+    draw[max_ends + 1] = (diffs == 0)[:, None, None]
+
+    for end in range(max_ends, 0, -1):
+        for ph in range(pp):
+            for po in range(pp):
+                best = None
+                for a, name in enumerate(ACTIONS):
+                    if name == "PP" and (ph == 0 or end <= 2):
+                        continue
+                    dist = probs[a, end]
+                    if not dist.any():
+                        continue
+                    ph_next = ph - (name == "PP")
+                    w = np.zeros(len(diffs))
+                    d = np.zeros(len(diffs))
+                    for i in np.flatnonzero(dist.any(axis=0)):
+                        result, p = int(outcomes[i]), dist[:, i]
+                        nxt = np.clip(diffs + result, -offset, offset) + offset
+                        if result < 0:
+                            # hammer team gives up points and keeps the hammer
+                            w += p * win[end + 1, nxt, ph_next, po]
+                            d += p * draw[end + 1, nxt, ph_next, po]
+                        else:
+                            # hammer passes, so the next end is seen from the other team
+                            opp = 2 * offset - nxt
+                            w += p * (1 - win[end + 1, opp, po, ph_next] - draw[end + 1, opp, po, ph_next])
+                            d += p * draw[end + 1, opp, po, ph_next]
+                    value = w + draw_value * d
+                    if best is None:
+                        best = value
+                        win[end, :, ph, po] = w
+                        draw[end, :, ph, po] = d
+                    else:
+                        better = value > best
+                        best = np.where(better, value, best)
+                        win[end, :, ph, po] = np.where(better, w, win[end, :, ph, po])
+                        draw[end, :, ph, po] = np.where(better, d, draw[end, :, ph, po])
+                        action[end, :, ph, po] = np.where(better, a, action[end, :, ph, po])
+
+    return PolicyTable(action, win.astype(np.float32), draw.astype(np.float32), max_ends, max_powerplays, draw_value, table_key)
+
+
+def load_policy(path = TABLE_PATH, prob_table = PROB_TABLE, max_ends = 8, max_powerplays = 1, draw_value = 0.5):
+    # the cached table is reused only while it was solved on this probability
+    # table and with these settings
+    if Path(path).exists():
+        policy = PolicyTable.load(path)
+        if (policy.table_key, policy.max_ends, policy.max_powerplays, policy.draw_value) == (prob_table.fingerprint, max_ends, max_powerplays, draw_value):
+            return policy
+    policy = solve(prob_table, max_ends, max_powerplays, draw_value)
+    policy.save(path)
+    return policy
+
+
+def sample_states(n, rng, max_ends = 8):
+    states = []
+    for _ in range(n):
+        hammer = int(rng.integers(1, 3))
+        lead = int(rng.integers(-4, 5))
+        states.append(GameState(
+            current_score = {hammer: max(lead, 0), 3 - hammer: max(-lead, 0)},
+            end_number = int(rng.integers(3, max_ends + 1)),
+            root_team = hammer,
+            hammer_team = hammer,
+            powerplay_used = {1: False, 2: False},
+            powerplays_remaining = {hammer: 1, 3 - hammer: int(rng.integers(0, 2))}
+        ))
+    return states
+
+
+def check(policy, n_states, num_simulations, seed = 0):
+    from mcts import MCTS
+    from bayesian_ev import bayesian_eval_continuous
+
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    end_sampler.seed(seed)
+    agree = 0
+    for state in sample_states(n_states, rng):
+        solver_action, value = policy.lookup(state)
+        mcts_action, _ = MCTS(bayesian_eval_continuous, num_simulations).search(state)
+        agree += solver_action == mcts_action
+        hammer = state.hammer_team
+        print(
+            f"end {state.end_number} lead {state.current_score[hammer] - state.current_score[3 - hammer]:+d} "
+            f"opp_pp {state.powerplays_remaining[3 - hammer]}: solver {solver_action} ({value:.3f}) mcts {mcts_action}"
+        )
+    print(f"Agreement: {agree}/{n_states} ({agree / n_states:.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exact power play policy by backward induction")
+    parser.add_argument("--draw-value", type=float, default=0.5)
+    parser.add_argument("--check", type=int, default=0, metavar="N", help="compare against MCTS on N sampled states")
+    parser.add_argument("--simulations", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    policy = solve(draw_value=args.draw_value)
+    elapsed = time.perf_counter() - start
+    policy.save()
+
+    print(f"Solved {policy.action.size} states in {elapsed * 1000:.1f} ms")
+    print(f"Table size: {policy.nbytes / 1024:.1f} KiB in memory, {TABLE_PATH.stat().st_size / 1024:.1f} KiB on disk")
+    print(f"Saved policy table to: {TABLE_PATH}")
+
+    if args.check:
+        check(policy, args.check, args.simulations, args.seed)
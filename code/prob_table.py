@@ -1,7 +1,243 @@
-PROB_TABLE_END_DIFF = {'PP': {1: {}, 2: {-1: 1.0}, 3: {1: 0.4666666666666667, -1: 0.2, 3: 0.13333333333333333, -2: 0.13333333333333333, 2: 0.06666666666666667}, 4: {1: 0.48148148148148145, 2: 0.18518518518518517, -1: 0.1111111111111111, -2: 0.1111111111111111, -3: 0.07407407407407407, 3: 0.037037037037037035}, 5: {1: 0.3246753246753247, 3: 0.22077922077922077, 2: 0.22077922077922077, -1: 0.15584415584415584, -2: 0.03896103896103896, 4: 0.025974025974025976, -3: 0.012987012987012988}, 6: {1: 0.33170731707317075, 2: 0.25853658536585367, 3: 0.16585365853658537, -1: 0.15609756097560976, -2: 0.02926829268292683, 5: 0.024390243902439025, 4: 0.014634146341463415, -3: 0.00975609756097561, 0: 0.004878048780487805, -4: 0.004878048780487805}, 7: {2: 0.3269230769230769, 1: 0.28365384615384615, 3: 0.14423076923076922, -1: 0.10576923076923077, -2: 0.052884615384615384, 4: 0.04807692307692308, -3: 0.014423076923076924, 5: 0.009615384615384616, 6: 0.009615384615384616, -4: 0.004807692307692308}, 8: {1: 0.35384615384615387, 0: 0.18461538461538463, 2: 0.15384615384615385, -1: 0.12307692307692308, 3: 0.1076923076923077, -2: 0.07692307692307693}}, 'NO_PP': {1: {1: 0.27906976744186046, -1: 0.27906976744186046, 2: 0.1308139534883721, -2: 0.1308139534883721, 3: 0.055232558139534885, -3: 0.055232558139534885, -4: 0.027616279069767442, 4: 0.027616279069767442, 5: 0.005813953488372093, -5: 0.005813953488372093, 0: 0.0029069767441860465}, 2: {1: 0.2852983988355167, -1: 0.2838427947598253, -2: 0.13828238719068414, 2: 0.13828238719068414, -3: 0.053857350800582245, 3: 0.053857350800582245, -4: 0.018922852983988356, 4: 0.018922852983988356, 5: 0.004366812227074236, -5: 0.004366812227074236}, 3: {-1: 0.32392273402674593, 1: 0.3179791976225854, 2: 0.1263001485884101, -2: 0.12481426448736999, -3: 0.03863298662704309, 3: 0.03566121842496285, 4: 0.01188707280832095, -4: 0.01188707280832095, 5: 0.0029717682020802376, -5: 0.0029717682020802376, 0: 0.0029717682020802376}, 4: {-1: 0.29046898638426627, 1: 0.2753403933434191, -2: 0.1437216338880484, 2: 0.14069591527987896, 3: 0.05446293494704992, -3: 0.0529500756429652, -4: 0.01664145234493192, 4: 0.01664145234493192, 0: 0.0030257186081694403, -5: 0.0030257186081694403, 5: 0.0030257186081694403}, 5: {-1: 0.28805237315875615, 1: 0.26677577741407527, -2: 0.14893617021276595, 2: 0.1260229132569558, -3: 0.08019639934533551, 3: 0.054009819967266774, -4: 0.014729950900163666, 4: 0.011456628477905073, -5: 0.004909983633387889, 5: 0.004909983633387889}, 6: {-1: 0.31262939958592134, 1: 0.23809523809523808, -2: 0.18840579710144928, -3: 0.09730848861283643, 2: 0.09109730848861283, 3: 0.031055900621118012, -4: 0.014492753623188406, -5: 0.012422360248447204, 4: 0.010351966873706004, 0: 0.002070393374741201, 5: 0.002070393374741201}, 7: {-1: 0.26666666666666666, -2: 0.22564102564102564, 1: 0.1717948717948718, -3: 0.12564102564102564, 2: 0.07948717948717948, 3: 0.05641025641025641, -4: 0.03333333333333333, 0: 0.015384615384615385, 4: 0.010256410256410256, -5: 0.007692307692307693, -6: 0.005128205128205128, 5: 0.002564102564102564}, 8: {0: 0.24940047961630696, -1: 0.24700239808153476, 1: 0.21103117505995203, -2: 0.10071942446043165, 2: 0.08872901678657075, -3: 0.047961630695443645, 3: 0.03117505995203837, -4: 0.011990407673860911, 4: 0.011990407673860911}}}
+import json
+import hashlib
+from bisect import bisect_right
+import argparse
+import numpy as np
+from pathlib import Path
+from datetime import datetime
 
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+ENDS_PATH = PROJECT_ROOT / "data_processing" / "processed_data" / "ends_processed.csv"
+TABLE_PATH = PROJECT_ROOT / "weights" / "prob_table_v1.npz"
+FORMAT_VERSION = 1
 
+ACTIONS = ("NO_PP", "PP")
+MAX_END = 8
 
+# End-result distributions as dense arrays indexed (action, end, outcome),
+# with action in ACTIONS order, end the end number (row 0 unused) and outcome
+# i meaning an end difference of outcomes[i]. Built from ends_processed.csv
+# the way the last cell of data_processing.ipynb built the old dict literal,
+# and saved as a versioned .npz artifact that is loaded at import.
+#
+# Optional variants:
+#   smoothing  pseudo-counts of the action's distribution pooled over all
+#              ends, added to every end, so sparse cells (PP in ends 1-2)
+#              get a usable distribution
+#   buckets    edges of hammer-relative score-difference buckets; adds
+#              bucket_probs / bucket_cdf indexed (action, end, bucket,
+#              outcome), each bucket smoothed toward its end's distribution
+#
+# The default table counts every row's own EndDiff, as the notebook did, so
+# the NO_PP cells mix both teams' points of view. Bucketed tables (or
+# --hammer-relative) count only the hammer team's rows, whose EndDiff and
+# PrevScoreDiff are already hammer-relative and which carry the PP call, so
+# the outcomes and the bucket index are on the side the samplers assume.
 
 
+def normalize(counts, prior = None, alpha = 0.0):
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = counts.sum(axis=-1, keepdims=True)
+    if prior is not None and alpha > 0:
+        counts = counts + alpha * prior
+        totals = totals + alpha
+    return np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
 
+def cumulative(probs):
+    # empty cells get an all-ones CDF, so a search always lands on index 0
+    cdf = np.cumsum(probs, axis=-1)
+    totals = cdf[..., -1:]
+    return np.divide(cdf, totals, out=np.ones_like(cdf), where=totals > 0)
+
+def dense_probs(prob_table):
+    # {action: {end: {result: p}}} -> (outcomes, probs indexed (action, end, outcome))
+    max_points = max(abs(r) for dist in prob_table.values() for end in dist.values() for r in end)
+    max_end = max(max(dist) for dist in prob_table.values())
+    outcomes = np.arange(-max_points, max_points + 1)
+
+    probs = np.zeros((len(ACTIONS), max_end + 1, len(outcomes)))
+    for a, action in enumerate(ACTIONS):
+        for end, dist in prob_table[action].items():
+            for result, p in dist.items():
+                probs[a, end, result + max_points] = p
+    return outcomes, probs
+
+def bucket_index(edges, score_diff):
+    return int(np.searchsorted(edges, score_diff, side="right"))
+
+
+class ProbTable:
+    def __init__(self, outcomes, counts, smoothing = 0.0, bucket_edges = None, bucket_counts = None, meta = None):
+        self.outcomes = np.asarray(outcomes, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.smoothing = float(smoothing)
+        self.meta = dict(meta or {})
+
+        pooled = normalize(self.counts.sum(axis=1, keepdims=True))
+        self.probs = normalize(self.counts, pooled, self.smoothing)
+        self.cdf = cumulative(self.probs)
+
+        self.bucket_edges = None if bucket_edges is None else np.asarray(bucket_edges, dtype=np.int64)
+        self.bucket_counts = None if bucket_counts is None else np.asarray(bucket_counts, dtype=np.int64)
+        if self.bucket_counts is not None:
+            # buckets fall back to their end's distribution when empty
+            prior = self.probs[:, :, None, :]
+            probs = normalize(self.bucket_counts, prior, self.smoothing)
+            empty = self.bucket_counts.sum(axis=-1, keepdims=True) == 0
+            self.bucket_probs = np.where(empty, prior, probs)
+            self.bucket_cdf = cumulative(self.bucket_probs)
+
+    @property
+    def conditional(self):
+        return self.bucket_counts is not None
+
+    def bucket(self, score_diff):
+        return bucket_index(self.bucket_edges, score_diff)
+
+    @property
+    def fingerprint(self):
+        # hash of the distributions the simulators use, for keying derived caches
+        h = hashlib.sha256()
+        arrays = [self.outcomes, self.probs]
+        if self.conditional:
+            arrays += [self.bucket_edges, self.bucket_probs]
+        for array in arrays:
+            h.update(np.ascontiguousarray(array).tobytes())
+        return h.hexdigest()
+
+    def as_dict(self, bucket = None):
+        # {action: {end: {result: p}}}, the layout of the old PROB_TABLE_END_DIFF
+        # literal; with a bucket, that score bucket's distributions
+        probs = self.probs if bucket is None else self.bucket_probs[:, :, bucket]
+        return {
+            action: {
+                end: {int(self.outcomes[i]): float(probs[a, end, i]) for i in np.flatnonzero(probs[a, end])}
+                for end in range(1, probs.shape[1])
+            }
+            for a, action in enumerate(ACTIONS)
+        }
+
+    def save(self, path = TABLE_PATH):
+        arrays = {
+            "outcomes": self.outcomes,
+            "counts": self.counts,
+            "probs": self.probs,
+            "cdf": self.cdf,
+            "meta": np.array(json.dumps({**self.meta, "version": FORMAT_VERSION, "smoothing": self.smoothing}))
+        }
+        if self.conditional:
+            arrays.update(
+                bucket_edges=self.bucket_edges,
+                bucket_counts=self.bucket_counts,
+                bucket_probs=self.bucket_probs,
+                bucket_cdf=self.bucket_cdf
+            )
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path = TABLE_PATH):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path} is a version {meta.get('version')} probability table; expected version {FORMAT_VERSION}")
+            return cls(
+                data["outcomes"], data["counts"], meta["smoothing"],
+                data["bucket_edges"] if "bucket_edges" in data.files else None,
+                data["bucket_counts"] if "bucket_counts" in data.files else None,
+                meta
+            )
+
+
+def build(ends, max_end = MAX_END, smoothing = 0.0, bucket_edges = None, hammer_relative = None, source = None):
+    # ends: DataFrame with PowerPlayBool, EndID, EndDiff (and Has_Hammer,
+    # PrevScoreDiff when bucketing), one row per team-end as in ends_processed.csv
+    if hammer_relative is None:
+        hammer_relative = bucket_edges is not None
+    if bucket_edges is not None and not hammer_relative:
+        raise ValueError("score buckets need a hammer-relative table")
+
+    ends = ends.loc[ends["EndID"].between(1, max_end)]
+    if hammer_relative:
+        ends = ends.loc[ends["Has_Hammer"] == 1]
+    max_points = int(ends["EndDiff"].abs().max())
+    outcomes = np.arange(-max_points, max_points + 1)
+
+    action = ends["PowerPlayBool"].to_numpy().astype(np.intp)
+    end = ends["EndID"].to_numpy().astype(np.intp)
+    outcome = ends["EndDiff"].to_numpy().astype(np.intp) + max_points
+
+    counts = np.zeros((len(ACTIONS), max_end + 1, len(outcomes)), dtype=np.int64)
+    np.add.at(counts, (action, end, outcome), 1)
+
+    bucket_counts = None
+    if bucket_edges is not None:
+        bucket_edges = np.sort(np.asarray(bucket_edges, dtype=np.int64))
+        # the hammer team's lead before the end
+        bucket = np.searchsorted(bucket_edges, ends["PrevScoreDiff"].to_numpy(), side="right")
+        bucket_counts = np.zeros((len(ACTIONS), max_end + 1, len(bucket_edges) + 1, len(outcomes)), dtype=np.int64)
+        np.add.at(bucket_counts, (action, end, bucket, outcome), 1)
+
+    meta = {"created": datetime.now().isoformat(timespec="seconds"), "rows": int(len(ends)), "hammer_relative": bool(hammer_relative)}
+    if source is not None:
+        meta["source"] = Path(source).name
+        meta["source_sha256"] = hashlib.sha256(Path(source).read_bytes()).hexdigest()
+    return ProbTable(outcomes, counts, smoothing, bucket_edges, bucket_counts, meta)
+
+def build_from_csv(path = ENDS_PATH, **kwargs):
+    import pandas as pd
+
+    columns = ["PowerPlayBool", "EndID", "EndDiff", "Has_Hammer", "PrevScoreDiff"]
+    return build(pd.read_csv(path, usecols=columns), source=path, **kwargs)
+
+
+def check_single_bucket(ends):
+    # one bucket covering every score must reproduce the end's own distribution
+    table = build(ends, bucket_edges=[])
+    for a, action in enumerate(ACTIONS):
+        for end in range(1, table.probs.shape[1]):
+            marginal = table.outcomes @ table.probs[a, end]
+            bucketed = table.outcomes @ table.bucket_probs[a, end, 0]
+            assert np.array_equal(table.bucket_probs[a, end, 0], table.probs[a, end]), (action, end)
+            assert abs(bucketed - marginal) < 1e-12, (action, end, bucketed, marginal)
+    return table
+
+
+PROB_TABLE = ProbTable.load()
+PROB_TABLE_END_DIFF = PROB_TABLE.as_dict()
+BUCKET_TABLES = [PROB_TABLE.as_dict(b) for b in range(len(PROB_TABLE.bucket_edges) + 1)] if PROB_TABLE.conditional else None
+
+def end_distribution(action, end, score_diff = 0):
+    # {result: p} for an end, given the hammer team's lead when the table has score buckets
+    if BUCKET_TABLES is None:
+        return PROB_TABLE_END_DIFF[action][end]
+    return BUCKET_TABLES[bisect_right(PROB_TABLE.bucket_edges.tolist(), score_diff)][action][end]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the end-result probability table from ends_processed.csv")
+    parser.add_argument("--ends", type=Path, default=ENDS_PATH)
+    parser.add_argument("--out", type=Path, default=TABLE_PATH)
+    parser.add_argument("--max-end", type=int, default=MAX_END)
+    parser.add_argument("--smoothing", type=float, default=0.0, help="pseudo-counts of the pooled action distribution added to each end")
+    parser.add_argument("--buckets", type=int, nargs="+", help="hammer-relative score-difference bucket edges, e.g. -3 -1 1 3")
+    parser.add_argument("--hammer-relative", action="store_true", help="count only the hammer team's rows (implied by --buckets)")
+    parser.add_argument("--check", action="store_true", help="check that a single score bucket reproduces the per-end table, then exit")
+    args = parser.parse_args()
+
+    if args.check:
+        import pandas as pd
+
+        table = check_single_bucket(pd.read_csv(args.ends, usecols=["PowerPlayBool", "EndID", "EndDiff", "Has_Hammer", "PrevScoreDiff"]))
+        means = table.probs @ table.outcomes
+        print(f"single bucket matches the per-end table; hammer-relative E[result], NO_PP ends 1-8: {np.round(means[0, 1:], 3).tolist()}")
+        raise SystemExit
+
+    table = build_from_csv(args.ends, max_end=args.max_end, smoothing=args.smoothing, bucket_edges=args.buckets, hammer_relative=args.hammer_relative or None)
+    for a, action in enumerate(ACTIONS):
+        n = table.counts[a, 1:].sum(axis=-1)
+        print(f"{action:>5} rows per end: {n.tolist()}")
+    if table.conditional:
+        print(f"buckets {table.bucket_edges.tolist()}: rows per bucket {table.bucket_counts.sum(axis=(0, 1, 3)).tolist()}")
+
+    table.save(args.out)
+    print(f"Saved probability table to: {args.out}")
@@ -0,0 +1,103 @@
+import time
+import argparse
+import numpy as np
+from mcts import win_prob
+from prob_table import PROB_TABLE, ProbTable
+from end_sampler import cumulative_tables, default_rng
+
+class VectorRollout:
+    # Runs many random-policy rollouts from one state at once. Same policy and
+    # reward as MCTSNode.simulate: each end picks uniformly among the legal
+    # actions, samples the end result, and adds win_prob of the EV difference
+    # between the root team and its opponent in the resulting state. With a
+    # score-bucketed table each rollout draws from its hammer lead's bucket.
+
+    def __init__(self, ev_batch, prob_table = PROB_TABLE):
+        self.ev_batch = ev_batch
+        self.outcomes, self.cdf = cumulative_tables(prob_table)
+        self.bucket_edges = None
+        if isinstance(prob_table, ProbTable) and prob_table.conditional:
+            self.bucket_edges, self.bucket_cdf = prob_table.bucket_edges, prob_table.bucket_cdf
+
+    def rollout(self, state, k, rng=None):
+        rng = default_rng() if rng is None else rng
+
+        root = state.root_team
+        opp = [t for t in state.current_score if t != root][0]
+
+        diff = np.full(k, state.current_score[root] - state.current_score[opp])
+        root_hammer = np.full(k, state.hammer_team == root)
+        pp_root = np.full(k, state.powerplays_remaining[root])
+        pp_opp = np.full(k, state.powerplays_remaining[opp])
+
+        total_reward = np.zeros(k)
+        for end in range(state.end_number, state.max_ends + 1):
+            pp_hammer = np.where(root_hammer, pp_root, pp_opp)
+            pp = (pp_hammer > 0) & (end > 2) & (rng.random(k) < 0.5)
+
+            if self.bucket_edges is None:
+                cdf = self.cdf[pp.astype(np.intp), end]
+            else:
+                bucket = np.searchsorted(self.bucket_edges, np.where(root_hammer, diff, -diff), side="right")
+                cdf = self.bucket_cdf[pp.astype(np.intp), end, bucket]
+            idx = (rng.random(k)[:, None] >= cdf).sum(axis=1)
+            result = self.outcomes[np.minimum(idx, len(self.outcomes) - 1)]
+
+            pp_root = pp_root - (pp & root_hammer)
+            pp_opp = pp_opp - (pp & ~root_hammer)
+
+            end_diff = np.where(root_hammer, result, -result)
+            diff = diff + end_diff
+            root_hammer = np.where(result >= 0, ~root_hammer, root_hammer)
+
+            next_end = np.full(k, end + 1)
+            zeros = np.zeros(k)
+            features = np.concatenate([
+                np.column_stack([root_hammer, zeros, next_end, diff, end_diff]),
+                np.column_stack([~root_hammer, zeros, next_end, -diff, -end_diff]),
+            ])
+            ev, _ = self.ev_batch(features)
+            ends_left = state.max_ends - (end + 1) + 1
+            total_reward += win_prob(ev[:k] - ev[k:], ends_left)
+
+        return total_reward
+
+
+if __name__ == "__main__":
+    from mcts import MCTSNode
+    from gamestate import GameState
+    from bayesian_ev import bayesian_eval_batch, bayesian_eval_continuous
+
+    parser = argparse.ArgumentParser(description="Compare vectorized rollouts against MCTSNode.simulate")
+    parser.add_argument("--rollouts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    engine = VectorRollout(bayesian_eval_batch)
+
+    for end, lead, hammer in [(1, 0, 1), (4, -2, 2), (6, 1, 1), (8, 0, 2)]:
+        state = GameState(
+            current_score = {1: max(lead, 0), 2: max(-lead, 0)},
+            end_number = end,
+            root_team = 1,
+            hammer_team = hammer,
+            powerplay_used = {1: False, 2: False}
+        )
+
+        start = time.perf_counter()
+        scalar = np.array([MCTSNode(state).simulate(bayesian_eval_continuous) for _ in range(args.rollouts)])
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector = engine.rollout(state, args.rollouts, rng)
+        vector_time = time.perf_counter() - start
+
+        se = np.sqrt(scalar.var() / len(scalar) + vector.var() / len(vector))
+        print(
+            f"end {end} lead {lead:+d} hammer {hammer}: "
+            f"simulate {scalar.mean():.4f} +/- {scalar.std():.4f} ({args.rollouts / scalar_time:.0f}/s), "
+            f"vector {vector.mean():.4f} +/- {vector.std():.4f} ({args.rollouts / vector_time:.0f}/s), "
+            f"z = {(scalar.mean() - vector.mean()) / se:+.2f}"
+        )
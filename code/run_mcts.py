@@ -1,194 +1,408 @@
+import os
 import json
+import hashlib
+import pickle
+import random
+import shutil
+import argparse
 import numpy as np
-from mcts import MCTS
+from mcts import MCTS, SearchStats
+from array_mcts import ArrayMCTS
 from pathlib import Path
-from copy import deepcopy
 from gamestate import GameState
-from prob_table import PROB_TABLE_END_DIFF
-from bayesian_ev import bayesian_eval_continuous
+import end_sampler
+from end_sampler import END_SAMPLER
+from policy_solver import load_policy
+from prob_table import PROB_TABLE
+from bayesian_ev import bayesian_eval_cached, ev_cache
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 SAVE_DIR = PROJECT_ROOT / "figures" / "simulations"
 
-matches = 100000
-root_team = 1 
-
-pp_calls_dict = {end: 0 for end in range(1, 9)}
-pp_calls_dict["matches"] = matches
-
-pp_wins_dict  = {end: 0 for end in range(1, 9)}
-pp_draws_dict = {end: 0 for end in range(1, 9)}
-pp_loss_dict  = {end: 0 for end in range(1, 9)}
-
-hammer_track = {"wins": 0, "draws": 0, "loss": 0}
-no_hammer_track = {"wins": 0, "draws": 0, "loss": 0}
-
-
-pp5_lead_check = {
-    "pp6_total": 0,
-    "caller_leading_after_5": 0,
-    "caller_tied_after_5": 0,
-    "caller_trailing_after_5": 0
-}
-
-pp5_lead_margin = {
-    "total": 0,
-    "by_margin": {} 
-}
-
-pp6_lead_check = {
-    "pp7_total": 0,
-    "caller_leading_after_6": 0,
-    "caller_tied_after_6": 0,
-    "caller_trailing_after_6": 0
-}
-
-pp6_lead_margin = {
-    "total": 0,
-    "by_margin": {} 
-}
-
-pp7_lead_check = {
-    "pp8_total": 0,
-    "caller_leading_after_7": 0,
-    "caller_tied_after_7": 0,
-    "caller_trailing_after_7": 0
-}
-
-pp7_lead_margin = {
-    "total": 0,
-    "by_margin": {} 
-}
-
-for _ in range(matches):
+# modules whose code decides a match's outcome; a checkpoint only resumes
+# when these and the probability table are unchanged
+SIMULATION_MODULES = ("run_mcts.py", "mcts.py", "array_mcts.py", "gamestate.py", "end_sampler.py", "prob_table.py", "policy_solver.py", "bayesian_ev.py")
+
+def code_fingerprint():
+    h = hashlib.sha256(PROB_TABLE.fingerprint.encode())
+    for name in SIMULATION_MODULES:
+        h.update((Path(__file__).parent / name).read_bytes())
+    return h.hexdigest()
+
+# SearchStats counters summed over a run
+SEARCH_TOTALS = ("simulations", "tree_size", "rollouts", "ev_calls", "wall_time")
+
+
+class MatchStats:
+    def __init__(self, matches=0):
+        self.matches = matches
+        self.reused_simulations = 0
+        self.ev_cache_hits = 0
+        self.ev_cache_misses = 0
+
+        # totals over every MCTS search in the run
+        self.searches = 0
+        self.search_stats = {key: 0 for key in SEARCH_TOTALS}
+        self.search_stats["max_depth"] = 0
+        self.search_stats["time"] = {phase: 0.0 for phase in SearchStats.PHASES}
+        self.search_stats["stop_reasons"] = {}
+
+        self.pp_calls_dict = {end: 0 for end in range(1, 9)}
+        self.pp_wins_dict  = {end: 0 for end in range(1, 9)}
+        self.pp_draws_dict = {end: 0 for end in range(1, 9)}
+        self.pp_loss_dict  = {end: 0 for end in range(1, 9)}
+
+        self.hammer_track = {"wins": 0, "draws": 0, "loss": 0}
+        self.no_hammer_track = {"wins": 0, "draws": 0, "loss": 0}
+
+        # lead of the power play caller going into ends 6, 7 and 8
+        self.lead_checks = {}
+        self.lead_margins = {}
+        for end in (6, 7, 8):
+            self.lead_checks[end] = {
+                f"pp{end}_total": 0,
+                f"caller_leading_after_{end - 1}": 0,
+                f"caller_tied_after_{end - 1}": 0,
+                f"caller_trailing_after_{end - 1}": 0
+            }
+            self.lead_margins[end] = {
+                "total": 0,
+                "by_margin": {}
+            }
+
+    def record_pp_call(self, end, lead):
+        self.pp_calls_dict[end] += 1
+        if end not in self.lead_checks:
+            return
+
+        check = self.lead_checks[end]
+        check[f"pp{end}_total"] += 1
+        if lead > 0:
+            check[f"caller_leading_after_{end - 1}"] += 1
+        elif lead < 0:
+            check[f"caller_trailing_after_{end - 1}"] += 1
+        else:
+            check[f"caller_tied_after_{end - 1}"] += 1
+
+        margin = self.lead_margins[end]
+        margin["total"] += 1
+        margin["by_margin"][lead] = margin["by_margin"].get(lead, 0) + 1
+
+    def record_search(self, search_stats):
+        self.searches += 1
+        self.reused_simulations += search_stats.reused_simulations
+        totals = self.search_stats
+        for key in SEARCH_TOTALS:
+            totals[key] += getattr(search_stats, key)
+        totals["max_depth"] = max(totals["max_depth"], search_stats.max_depth)
+        for phase, seconds in search_stats.time.items():
+            totals["time"][phase] += seconds
+        reasons = totals["stop_reasons"]
+        reasons[search_stats.stop_reason] = reasons.get(search_stats.stop_reason, 0) + 1
+
+    def merge(self, other):
+        self.matches += other.matches
+        self.reused_simulations += other.reused_simulations
+        self.ev_cache_hits += other.ev_cache_hits
+        self.ev_cache_misses += other.ev_cache_misses
+
+        self.searches += other.searches
+        for key in SEARCH_TOTALS:
+            self.search_stats[key] += other.search_stats[key]
+        self.search_stats["max_depth"] = max(self.search_stats["max_depth"], other.search_stats["max_depth"])
+        for phase, seconds in other.search_stats["time"].items():
+            self.search_stats["time"][phase] += seconds
+        reasons = self.search_stats["stop_reasons"]
+        for reason, count in other.search_stats["stop_reasons"].items():
+            reasons[reason] = reasons.get(reason, 0) + count
+        for mine, theirs in [
+            (self.pp_calls_dict, other.pp_calls_dict),
+            (self.pp_wins_dict, other.pp_wins_dict),
+            (self.pp_draws_dict, other.pp_draws_dict),
+            (self.pp_loss_dict, other.pp_loss_dict),
+            (self.hammer_track, other.hammer_track),
+            (self.no_hammer_track, other.no_hammer_track),
+        ] + [(self.lead_checks[end], other.lead_checks[end]) for end in self.lead_checks]:
+            for k, v in theirs.items():
+                mine[k] += v
+
+        for end, margin in self.lead_margins.items():
+            margin["total"] += other.lead_margins[end]["total"]
+            for lead, count in other.lead_margins[end]["by_margin"].items():
+                margin["by_margin"][lead] = margin["by_margin"].get(lead, 0) + count
+        return self
+
+    def to_json(self):
+        hammer_analysis = {
+            "hammer_start": self.hammer_track,
+            "no_hammer_start": self.no_hammer_track
+        }
+        return [
+            {**self.pp_calls_dict, "matches": self.matches}, self.pp_wins_dict, self.pp_loss_dict, self.pp_draws_dict,
+            hammer_analysis,
+            self.lead_checks[6], self.lead_margins[6],
+            self.lead_checks[7], self.lead_margins[7],
+            self.lead_checks[8], self.lead_margins[8]
+        ]
+
+
+def play_match(stats, search):
     hammer = np.random.choice([1, 2])
     start_hammer = hammer
     powerplay_used = {1: False, 2: False}
     powerplays_remaining = {1: 1, 2: 1}
     current_score = {1: 0, 2: 0}
-    
+
     pp_end_by_team = {1: None, 2: None}
-    
 
     for end in range(1, 9):
         acting_team = hammer
 
         state = GameState(
-            current_score = deepcopy(current_score),
-            end_number = end, 
+            current_score = current_score,
+            end_number = end,
             root_team = acting_team,
             hammer_team = hammer,
-            powerplay_used = deepcopy(powerplay_used),
-            powerplays_remaining = deepcopy(powerplays_remaining)
-        )   
+            powerplay_used = powerplay_used,
+            powerplays_remaining = powerplays_remaining
+        )
+
+        best_action, _ = search.search(state)
 
-        mcts = MCTS(bayesian_eval_continuous, 1000)
-        best_action, _ = mcts.search(state)
-        
         if best_action == "PP" and powerplays_remaining[acting_team] <= 0:
             best_action = "NO_PP"
 
         if best_action == "PP" and powerplays_remaining[acting_team] > 0:
             if pp_end_by_team[acting_team] is None:
                 pp_end_by_team[acting_team] = end
-                pp_calls_dict[end] += 1
-
                 lead = int(current_score[acting_team] - current_score[3 - acting_team])
-
-                if end == 6:
-                    pp5_lead_check["pp6_total"] += 1
-                    if lead > 0:
-                        pp5_lead_check["caller_leading_after_5"] += 1
-                    elif lead < 0:
-                        pp5_lead_check["caller_trailing_after_5"] += 1
-                    else:
-                        pp5_lead_check["caller_tied_after_5"] += 1
-
-                    pp5_lead_margin["total"] += 1
-                    pp5_lead_margin["by_margin"][lead] = pp5_lead_margin["by_margin"].get(lead, 0) + 1
-
-                if end == 7:
-                    pp6_lead_check["pp7_total"] += 1
-                    if lead > 0:
-                        pp6_lead_check["caller_leading_after_6"] += 1
-                    elif lead < 0:
-                        pp6_lead_check["caller_trailing_after_6"] += 1
-                    else:
-                        pp6_lead_check["caller_tied_after_6"] += 1
-
-                    pp6_lead_margin["total"] += 1
-                    pp6_lead_margin["by_margin"][lead] = pp6_lead_margin["by_margin"].get(lead, 0) + 1
-
-                if end == 8:
-                    pp7_lead_check["pp8_total"] += 1
-                    if lead > 0:
-                        pp7_lead_check["caller_leading_after_7"] += 1
-                    elif lead < 0:
-                        pp7_lead_check["caller_trailing_after_7"] += 1
-                    else:
-                        pp7_lead_check["caller_tied_after_7"] += 1
-
-                    pp7_lead_margin["total"] += 1
-                    pp7_lead_margin["by_margin"][lead] = pp7_lead_margin["by_margin"].get(lead, 0) + 1
+                stats.record_pp_call(end, lead)
 
             powerplay_used[acting_team] = True
             powerplays_remaining[acting_team] -= 1
 
-        
-        dist = PROB_TABLE_END_DIFF[best_action][end]
-        outcomes = list(dist.keys())
-        probs = np.array(list(dist.values()), dtype=float)
-        result = np.random.choice(outcomes, p=probs)        
+        result = END_SAMPLER.draw_given(best_action, end, current_score[hammer] - current_score[3 - hammer])
 
         if result > 0:
             current_score[hammer] += result
         elif result < 0:
             current_score[3 - hammer] += -result
- 
-        if result  > 0: 
-            hammer = 3 - hammer  
-        elif result < 0:  
-            hammer = hammer  
-        else:  
-            hammer = 3 - hammer  
+
+        if result  > 0:
+            hammer = 3 - hammer
+        elif result < 0:
+            hammer = hammer
+        else:
+            hammer = 3 - hammer
 
     for team, pp_end in pp_end_by_team.items():
         if pp_end is None:
             continue
         opp = 3 - team
         if current_score[team] > current_score[opp]:
-            pp_wins_dict[pp_end] += 1
+            stats.pp_wins_dict[pp_end] += 1
         elif current_score[team] < current_score[opp]:
-            pp_loss_dict[pp_end] += 1
+            stats.pp_loss_dict[pp_end] += 1
         else:
-            pp_draws_dict[pp_end] += 1
-
-
+            stats.pp_draws_dict[pp_end] += 1
 
     if current_score[start_hammer] > current_score[3 - start_hammer]:
-        hammer_track["wins"] += 1
-        no_hammer_track["loss"] += 1
+        stats.hammer_track["wins"] += 1
+        stats.no_hammer_track["loss"] += 1
     elif current_score[start_hammer] < current_score[3 - start_hammer]:
-        hammer_track["loss"] += 1
-        no_hammer_track["wins"] += 1
+        stats.hammer_track["loss"] += 1
+        stats.no_hammer_track["wins"] += 1
     else:
-        hammer_track["draws"] += 1
-        no_hammer_track["draws"] += 1
-    
-
-hammer_analysis = {
-    "hammer_start": hammer_track,
-    "no_hammer_start": no_hammer_track
-}
-
-with open(SAVE_DIR / f'frequency_dict_{matches}.json', 'w') as f:
-    json.dump([
-        pp_calls_dict, pp_wins_dict, pp_loss_dict, pp_draws_dict,
-        hammer_analysis,
-        pp5_lead_check, pp5_lead_margin,
-        pp6_lead_check, pp6_lead_margin,
-        pp7_lead_check, pp7_lead_margin
-    ], f, indent=4)
-
-
-
+        stats.hammer_track["draws"] += 1
+        stats.no_hammer_track["draws"] += 1
+
+
+def rng_state():
+    return {
+        "random": random.getstate(),
+        "numpy": np.random.get_state(),
+        "end_sampler": end_sampler.get_state()
+    }
+
+def set_rng_state(state):
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy"])
+    end_sampler.set_state(state["end_sampler"])
+
+
+def save_checkpoint(path, checkpoint):
+    # write to a temporary file and rename, so a crash mid-write never
+    # leaves a truncated checkpoint behind
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_checkpoint(path, config):
+    if path is None or not path.exists():
+        return None
+    with open(path, "rb") as f:
+        checkpoint = pickle.load(f)
+    if checkpoint["config"] != config:
+        raise ValueError(f"Checkpoint {path} was written for {checkpoint['config']}, not {config}")
+    return checkpoint
+
+
+def run_shard(shard_matches, seed_seq, num_simulations=1000, policy="mcts", reuse_tree=False, checkpoint_path=None, checkpoint_every=0, profile=False, search_options=None, tree="object", solver=None):
+    # MCTS, GameState and the end sampler draw from shared module-level
+    # streams, so each shard reseeds them from its own SeedSequence
+    np.random.seed(seed_seq.generate_state(4))
+    random.seed(int(seed_seq.generate_state(1)[0]))
+    end_sampler.seed(seed_seq)
+
+    config = {
+        "shard_matches": shard_matches,
+        "entropy": seed_seq.entropy,
+        "spawn_key": seed_seq.spawn_key,
+        "num_simulations": num_simulations,
+        "policy": policy,
+        "reuse_tree": reuse_tree,
+        "search_options": search_options,
+        "tree": tree,
+        "code": code_fingerprint()
+    }
+    stats = MatchStats(shard_matches)
+    done = 0
+    checkpoint = load_checkpoint(checkpoint_path, config)
+    if checkpoint is not None:
+        stats.__dict__.update(checkpoint["stats"])
+        done = checkpoint["done"]
+        set_rng_state(checkpoint["rng"])
+
+    # ev_cache counters are per process and a worker can run several shards,
+    # so each match adds only the lookups it made
+    hits, misses = ev_cache.hits, ev_cache.misses
+    for i in range(done, shard_matches):
+        if solver is not None:
+            play_match(stats, solver)
+        else:
+            search_class = ArrayMCTS if tree == "array" else MCTS
+            mcts = search_class(bayesian_eval_cached, num_simulations, reuse_tree=reuse_tree, callback=stats.record_search, profile=profile, **(search_options or {}))
+            play_match(stats, mcts)
+        stats.ev_cache_hits += ev_cache.hits - hits
+        stats.ev_cache_misses += ev_cache.misses - misses
+        hits, misses = ev_cache.hits, ev_cache.misses
+
+        if checkpoint_path is not None and checkpoint_every and ((i + 1) % checkpoint_every == 0 or i + 1 == shard_matches):
+            save_checkpoint(checkpoint_path, {"config": config, "done": i + 1, "stats": vars(stats), "rng": rng_state()})
+
+    return stats
+
+
+def simulate_matches(matches, workers=1, seed=0, num_simulations=1000, policy="mcts", reuse_tree=False, checkpoint_dir=None, checkpoint_every=0, profile=False, search_options=None, tree="object"):
+    seed_seqs = np.random.SeedSequence(seed).spawn(workers)
+    shard_sizes = [matches // workers + (i < matches % workers) for i in range(workers)]
+
+    # the policy table is loaded (or solved and saved) once here and shipped
+    # to the shards, so workers never race on weights/policy_table.npz
+    solver = load_policy() if policy == "solver" else None
+
+    checkpoint_paths = [None] * workers
+    if checkpoint_dir is not None:
+        checkpoint_dir = Path(checkpoint_dir)
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        checkpoint_paths = [checkpoint_dir / f"shard_{i}_of_{workers}.pkl" for i in range(workers)]
+
+    run = partial(
+        run_shard,
+        num_simulations=num_simulations,
+        policy=policy,
+        reuse_tree=reuse_tree,
+        checkpoint_every=checkpoint_every,
+        profile=profile,
+        search_options=search_options,
+        tree=tree,
+        solver=solver
+    )
+    if workers == 1:
+        shards = [run(shard_sizes[0], seed_seqs[0], checkpoint_path=checkpoint_paths[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run, n, s, checkpoint_path=p) for n, s, p in zip(shard_sizes, seed_seqs, checkpoint_paths)]
+            shards = [f.result() for f in futures]
+
+    # the run finished, so its checkpoints would only short-circuit a rerun
+    for path in checkpoint_paths:
+        if path is not None and path.exists():
+            path.unlink()
+    if checkpoint_dir is not None and not any(checkpoint_dir.iterdir()):
+        checkpoint_dir.rmdir()
+
+    stats = MatchStats()
+    for shard in shards:
+        stats.merge(shard)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate matches with the MCTS power play agent")
+    parser.add_argument("--matches", type=int, default=100000)
+    parser.add_argument("--simulations", type=int, default=1000, help="MCTS simulations per search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="processes to shard the matches over; results are reproducible for a given seed and worker count, so the default is fixed rather than the CPU count")
+    parser.add_argument("--policy", choices=["mcts", "solver"], default="mcts", help="solver uses the exact backward-induction table from policy_solver.py")
+    parser.add_argument("--reuse-tree", action="store_true", help="carry the matching MCTS subtree over from one end to the next")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="matches per shard between checkpoints (0 disables)")
+    parser.add_argument("--checkpoint-dir", type=Path, default=None)
+    parser.add_argument("--fresh", action="store_true", help="ignore existing checkpoints")
+    parser.add_argument("--profile", action="store_true", help="time the phases of every MCTS search")
+    parser.add_argument("--early-stop", action="store_true", help="stop a search once the root actions' confidence intervals separate")
+    parser.add_argument("--confidence", type=float, default=0.99, help="interval level for --early-stop")
+    parser.add_argument("--leaf-depth", type=int, default=None, help="ends played per rollout before the analytic leaf value takes over (0 skips rollouts)")
+    parser.add_argument("--tree", choices=["object", "array"], default="object", help="MCTS tree storage: linked MCTSNode objects or array_mcts.TreeStore")
+    parser.add_argument("--time-budget", type=float, default=None, help="seconds per search (--simulations stays the cap)")
+    args = parser.parse_args()
+
+    checkpoint_dir = args.checkpoint_dir
+    if checkpoint_dir is None and args.checkpoint_every:
+        checkpoint_dir = SAVE_DIR / "checkpoints" / f"{args.policy}_{args.matches}_{args.simulations}_{args.seed}_{args.workers}"
+    if args.fresh and checkpoint_dir is not None and checkpoint_dir.exists():
+        shutil.rmtree(checkpoint_dir)
+
+    stats = simulate_matches(
+        args.matches, args.workers, args.seed,
+        num_simulations=args.simulations,
+        policy=args.policy,
+        reuse_tree=args.reuse_tree,
+        checkpoint_dir=checkpoint_dir,
+        checkpoint_every=args.checkpoint_every,
+        profile=args.profile,
+        search_options={
+            "early_stop": args.early_stop,
+            "confidence": args.confidence,
+            "time_budget": args.time_budget,
+            "leaf_depth": args.leaf_depth
+        },
+        tree=args.tree
+    )
+
+    if args.reuse_tree:
+        print(f"Tree reuse saved {stats.reused_simulations / args.matches:.1f} of {8 * args.simulations} simulations per match")
+
+    if stats.searches:
+        totals = stats.search_stats
+        searched = sum(totals["time"].values())  # only non-zero with --profile
+        print(
+            f"Search: {stats.searches} searches, {totals['simulations'] / stats.searches:.0f} simulations, "
+            f"{totals['tree_size'] / stats.searches:.0f} nodes and {totals['ev_calls'] / stats.searches:.0f} EV calls per search, "
+            f"max depth {totals['max_depth']}"
+        )
+        print("Stopped by: " + ", ".join(f"{reason} {count / stats.searches:.0%}" for reason, count in totals["stop_reasons"].items()))
+        if searched:
+            print("Search time: " + ", ".join(f"{phase} {seconds / searched:.0%}" for phase, seconds in totals["time"].items()))
+
+    lookups = stats.ev_cache_hits + stats.ev_cache_misses
+    if lookups:
+        print(f"EV cache: {stats.ev_cache_hits} hits, {stats.ev_cache_misses} misses ({stats.ev_cache_hits / lookups:.1%} hit rate)")
+
+    with open(SAVE_DIR / f'frequency_dict_{args.matches}.json', 'w') as f:
+        json.dump(stats.to_json(), f, indent=4)
@@ -1,64 +1,77 @@
-import torch
+import time
+import argparse
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from bayesian_ev import bayesian_eval_continuous
+from bayesian_ev import FEATURES, FEATURE_ALIASES, POSTERIOR_FILES, bayesian_eval_batch, get_posterior, load_posterior
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "data_processing" / "train_test_data"
 SAVE_DIR = PROJECT_ROOT / "data_processing" / "model_results"
 
 def neg_log_likelihood(pred_means, pred_stds, y):
-    pred_stds = torch.clamp(pred_stds, min=1e-6)
-    dist = torch.distributions.Normal(pred_means, pred_stds)
-    return -dist.log_prob(y).mean()
+    pred_stds = np.clip(pred_stds, 1e-6, None)
+    z = (y - pred_means) / pred_stds
+    return np.mean(0.5 * z ** 2 + np.log(pred_stds) + 0.5 * np.log(2 * np.pi))
 
 def coverage(y, mu, sigma):
-    z = torch.tensor(1.96)
+    z = 1.96
     lower = mu - z * sigma
     upper = mu + z * sigma
-    return ((y >= lower) & (y <= upper)).float().mean()
+    return np.mean((y >= lower) & (y <= upper))
 
-def test_model(X, y, model):
-    mus, ys = [], []
+def test_model(X, y, posterior):
+    start = time.perf_counter()
 
-    for i in range(len(X)):
-        x_row = X.iloc[i].to_dict()
-        mu, _ = model(x_row)
+    mus, stds = bayesian_eval_batch(X.rename(columns=FEATURE_ALIASES)[FEATURES].values, posterior)
+    # predictive spread: uncertainty in the mean plus the observation noise
+    pred_stds = np.sqrt(stds.astype(np.float64) ** 2 + np.mean(posterior["sigma"].astype(np.float64) ** 2))
 
-        mus.append(mu)
-        ys.append(y.iloc[i])
+    mus = mus.astype(np.float64)
+    ys = y.to_numpy(dtype=np.float64)
 
-    mus = torch.tensor(mus, dtype = torch.float) 
-    ys = torch.tensor(ys, dtype = torch.float)
-
-    rmse = torch.sqrt(((mus - ys) ** 2).mean()).item()
-    mae = torch.mean(torch.abs(mus - ys)).item()
-    bias = torch.mean(mus - ys).item()
-    r2 = 1 - torch.sum((mus - ys) ** 2) / torch.sum((ys - ys.mean()) ** 2)
-    r2 = r2.item()
+    rmse = np.sqrt(((mus - ys) ** 2).mean())
+    mae = np.mean(np.abs(mus - ys))
+    bias = np.mean(mus - ys)
+    r2 = 1 - np.sum((mus - ys) ** 2) / np.sum((ys - ys.mean()) ** 2)
 
     return {
         "RMSE": rmse,
         "MAE": mae,
         "Bias": bias,
-        "R2": r2
+        "R2": r2,
+        "NLL": neg_log_likelihood(mus, pred_stds, ys),
+        "Coverage95": coverage(ys, mus, pred_stds),
+        "Rows": len(ys),
+        "WallTime": time.perf_counter() - start
     }
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate posteriors on the held-out test set")
+    parser.add_argument("posteriors", nargs="*", help="posterior names from POSTERIOR_FILES or paths to .pt/.npz files (default: all named posteriors)")
+    parser.add_argument("--tile", type=int, default=1, help="repeat the test set this many times to check scaling")
+    args = parser.parse_args()
+
     features = ["Has_Hammer", "PowerPlayBool", "EndID", "PrevScoreDiff", "PrevEndDiff"]
 
     test_df = pd.read_csv(
         DATA_DIR / "test_df.csv"
     )
+    test_df = pd.concat([test_df] * args.tile, ignore_index=True)
 
     X = test_df[features]
     y = test_df["Result"]
 
-    results_cont = test_model(X, y, bayesian_eval_continuous)
+    results = []
+    for name in args.posteriors or POSTERIOR_FILES:
+        posterior = get_posterior(name) if name in POSTERIOR_FILES else load_posterior(name)
+        results.append({"Posterior": Path(str(POSTERIOR_FILES.get(name, name))).stem, **test_model(X, y, posterior)})
 
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
 
-    pd.DataFrame([results_cont]).to_csv(
+    results.to_csv(
         SAVE_DIR / "Model_Results_Continuous.csv",
         index=False
-    )
\ No newline at end of file
+    )
@@ -1,26 +1,36 @@
+import time
 import pyro
 import uuid
 import torch
+import argparse
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
+import multiprocessing as mp
 import pyro.distributions as dist
-from pyro.infer import MCMC, NUTS
+from concurrent.futures import ProcessPoolExecutor
+from pyro.infer import MCMC, NUTS, SVI, Trace_ELBO, Predictive
+from pyro.infer.autoguide import AutoNormal
+from pyro.ops.stats import effective_sample_size, split_gelman_rubin
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "data_processing" / "train_test_data"
 SAVE_DIR = PROJECT_ROOT / "weights" / "testing_weights"
 
-df = pd.read_csv(DATA_DIR / "train_df.csv")
-
 features = ["Has_Hammer",
             "PowerPlayBool",
             "EndID",
             "PrevScoreDiff",
             "PrevEndDiff"]
 
-X = torch.tensor(df[features].values, dtype=torch.float)
-y = torch.tensor(df["Result"].values, dtype=torch.long)
+SITES = ["w", "b", "sigma"]
+
+def load_training_data(path = DATA_DIR / "train_df.csv"):
+    df = pd.read_csv(path)
+    X = torch.tensor(df[features].values, dtype=torch.float)
+    y = torch.tensor(df["Result"].values, dtype=torch.long)
+    return X, y
 
 def BaysianRegression(X, y=None):
     _, d = X.shape
@@ -30,22 +40,129 @@ def BaysianRegression(X, y=None):
     mu = X @ w + b
     pyro.sample("obs", dist.Normal(mu, sigma), obs=y)
 
-if __name__ == "__main__":
-    model = BaysianRegression
-    nuts_kernel = NUTS(model)
-    mcmc = MCMC(nuts_kernel, num_samples=1000, warmup_steps=200)
+
+def run_chain(seed, num_samples = 1000, warmup_steps = 200):
+    # one NUTS chain in its own process; returns NumPy arrays so results
+    # pickle back to the parent without torch tensors shared across processes
+    torch.set_num_threads(1)
+    pyro.set_rng_seed(seed)
+    X, y = load_training_data()
+    mcmc = MCMC(NUTS(BaysianRegression), num_samples=num_samples, warmup_steps=warmup_steps, disable_progbar=True)
     mcmc.run(X, y)
+    return {k: v.numpy() for k, v in mcmc.get_samples().items()}
 
-    posterior = mcmc.get_samples()
-    print(posterior["w"].mean(0), posterior["b"].mean())
-    print("Posterior b:", posterior["b"].mean())
+def train_nuts(chains = 4, num_samples = 1000, warmup_steps = 200, seed = 0, workers = None):
+    # num_samples is the total kept across chains, so the saved posterior is the
+    # same size, and costs downstream EV evaluation the same, for any chain count
+    seeds = [seed + chain for chain in range(chains)]
+    per_chain = -(-num_samples // chains)
+    if chains == 1:
+        samples = [run_chain(seeds[0], per_chain, warmup_steps)]
+    else:
+        # spawn rather than fork: torch's thread pools do not survive a fork
+        with ProcessPoolExecutor(max_workers=workers or chains, mp_context=mp.get_context("spawn")) as pool:
+            samples = list(pool.map(run_chain, seeds, [per_chain] * chains, [warmup_steps] * chains))
+
+    # (chain, sample, ...) for the diagnostics, then flattened into the weights layout
+    by_chain = {k: torch.tensor(np.stack([s[k] for s in samples])) for k in SITES}
+    diagnostics = {
+        k: {
+            "r_hat": split_gelman_rubin(v).numpy(),
+            "ess": effective_sample_size(v).numpy()
+        }
+        for k, v in by_chain.items()
+    }
+    # pooled draws thinned evenly back to num_samples when chains do not divide it
+    keep = np.linspace(0, per_chain * chains - 1, num_samples).round().astype(np.intp)
+    posterior = {k: v.reshape((-1,) + v.shape[2:]).numpy()[keep] for k, v in by_chain.items()}
+    return posterior, diagnostics
+
+def train_svi(steps = 5000, lr = 0.01, num_samples = 1000, seed = 0):
+    # mean-field normal approximation; fast, but it ignores posterior
+    # correlations between the weights
+    pyro.set_rng_seed(seed)
+    pyro.clear_param_store()
+    X, y = load_training_data()
+
+    guide = AutoNormal(BaysianRegression)
+    svi = SVI(BaysianRegression, guide, pyro.optim.Adam({"lr": lr}), loss=Trace_ELBO())
+    for step in range(steps):
+        loss = svi.step(X, y)
+        if (step + 1) % 1000 == 0:
+            print(f"step {step + 1}: ELBO loss {loss / len(y):.4f} per row")
+
+    predictive = Predictive(BaysianRegression, guide=guide, num_samples=num_samples, return_sites=SITES)
+    samples = {k: v.detach().numpy() for k, v in predictive(X).items()}
+    return {
+        "w": samples["w"].reshape(num_samples, X.shape[1]),
+        "b": samples["b"].reshape(num_samples),
+        "sigma": samples["sigma"].reshape(num_samples)
+    }
+
+
+def agreement(posterior, baseline):
+    # parameter means in units of the baseline's posterior sd, and the
+    # largest EV difference over the test set
+    from bayesian_ev import bayesian_eval_batch
+
+    rows = {}
+    for k in SITES:
+        p = np.asarray(posterior[k], dtype=np.float64)
+        q = np.asarray(baseline[k], dtype=np.float64)
+        rows[k] = (p.mean(0) - q.mean(0)) / q.std(0)
+
+    X = pd.read_csv(DATA_DIR / "test_df.csv")[features].values
+    mean, std = bayesian_eval_batch(X, {k: np.asarray(v, dtype=np.float32) for k, v in posterior.items()})
+    base_mean, base_std = bayesian_eval_batch(X, baseline)
+    return rows, float(np.abs(mean - base_mean).max()), float(np.abs(std - base_std).max())
+
+def save_posterior(posterior, model_name = BaysianRegression.__name__, save_dir = SAVE_DIR):
+    from bayesian_ev import export_posterior
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     uid = uuid.uuid4().hex[:8]
-    model_name = model.__name__
-
     filename = f"unitddpm_{model_name}_{timestamp}_{uid}_weights.pt"
 
-    torch.save(posterior, SAVE_DIR / filename)
+    path = Path(save_dir) / filename
+    torch.save({k: torch.as_tensor(v) for k, v in posterior.items()}, path)
+    export_posterior(path)  # NumPy copy for torch-free loading in bayesian_ev
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Bayesian regression EV model")
+    parser.add_argument("--mode", choices=["nuts", "svi"], default="nuts")
+    parser.add_argument("--chains", type=int, default=4, help="NUTS chains, one process each")
+    parser.add_argument("--workers", type=int, default=None, help="processes for the chains (default: one per chain)")
+    parser.add_argument("--samples", type=int, default=1000, help="posterior samples kept in total, split across the NUTS chains, or drawn from the guide (SVI)")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=5000, help="SVI optimization steps")
+    parser.add_argument("--lr", type=float, default=0.01, help="SVI learning rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default="production", help="posterior name or path to compare against")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.mode == "nuts":
+        posterior, diagnostics = train_nuts(args.chains, args.samples, args.warmup, args.seed, args.workers)
+    else:
+        posterior, diagnostics = train_svi(args.steps, args.lr, args.samples, args.seed), None
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.mode} finished in {elapsed:.1f}s with {len(posterior['b'])} samples")
+    print("Posterior w:", posterior["w"].mean(0))
+    print("Posterior b:", posterior["b"].mean())
+
+    if diagnostics is not None:
+        for k, d in diagnostics.items():
+            print(f"{k:>6}: R-hat max {np.max(d['r_hat']):.3f}, ESS min {np.min(d['ess']):.0f}")
+
+    from bayesian_ev import POSTERIOR_FILES, get_posterior, load_posterior
+    baseline = get_posterior(args.baseline) if args.baseline in POSTERIOR_FILES else load_posterior(args.baseline)
+    shifts, ev_mean_diff, ev_std_diff = agreement(posterior, baseline)
+    for k, shift in shifts.items():
+        print(f"{k:>6}: mean shift vs baseline {np.round(shift, 3)} baseline sd")
+    print(f"Test-set EV vs baseline: max |mean diff| {ev_mean_diff:.4f}, max |std diff| {ev_std_diff:.4f}")
 
-    print(f"Saved weights to: {SAVE_DIR / filename}")
\ No newline at end of file
+    path = save_posterior(posterior)
+    print(f"Saved weights to: {path}")
@@ -2,14 +2,17 @@ import json
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from data_cache import load_table
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DATA_DIR = PROJECT_ROOT / "data_processing" / "processed_data"
 SIMULATIONS_DIR = PROJECT_ROOT / "figures" / "simulations"
 SAVE_DIR_PRIOR = PROJECT_ROOT / "figures" / "analysis" / "data_analysis"
 SAVE_DIR_SIM = PROJECT_ROOT / "figures" / "analysis" / "simulation_statistics"
 
-df = pd.read_csv(DATA_DIR / "ends_processed.csv")
+df = load_table("ends_processed", columns=[
+    "GameUID", "TeamID", "EndID", "PowerPlayBool", "Has_Hammer",
+    "PrevScoreDiff", "CumulativeScore", "OpponentCumulative"
+])
 
 def stats_from_series(s: pd.Series):
     """Return mean/median/mode/quantiles in the same schema you used."""
@@ -39,13 +42,13 @@ def stats_from_series(s: pd.Series):
 
 pp = df[df["PowerPlayBool"] == 1].copy()
 
-pp_counts = pp.groupby("EndID").size().sort_index()
+pp_counts = pp.groupby("EndID", observed=True).size().sort_index()
 pp_total = int(pp_counts.sum())
 pp_freq_pct = (pp_counts / pp_total).sort_index()
 
 finals = (
     df.sort_values("EndID")
-      .groupby(["GameUID", "TeamID"], as_index=False)
+      .groupby(["GameUID", "TeamID"], as_index=False, observed=True)
       .tail(1)
       .copy()
 )
@@ -60,9 +63,9 @@ pp = pp.merge(
     how="left"
 )
 
-pp_win = pp.groupby("EndID")["Win"].mean().sort_index()
-pp_draw = pp.groupby("EndID")["Draw"].mean().sort_index()
-pp_loss = pp.groupby("EndID")["Loss"].mean().sort_index()
+pp_win = pp.groupby("EndID", observed=True)["Win"].mean().sort_index()
+pp_draw = pp.groupby("EndID", observed=True)["Draw"].mean().sort_index()
+pp_loss = pp.groupby("EndID", observed=True)["Loss"].mean().sort_index()
 pp_win_draw = (pp_win + pp_draw).sort_index()
 
 pp_6_8 = pp[pp["EndID"].isin([6, 7, 8])].copy()
@@ -0,0 +1,140 @@
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = PROJECT_ROOT / "data_processing" / "processed_data"
+CACHE_DIR = DATA_DIR / "cache"
+CACHE_VERSION = 1
+
+TABLES = ["ends_processed", "stones_processed", "games_processed", "ends_with_counterfactual"]
+
+# Typed columnar copies of the processed CSVs. Each table is parsed once,
+# strings become categoricals and integers the smallest dtype that holds
+# them, and the result is stored as Parquet, or as one .npy file per column
+# when pyarrow is not installed. Floats are kept as float64 so every number
+# matches the CSV. A cache is rebuilt when its CSV's size or mtime changes.
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def fingerprint(path):
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def typed(df):
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_integer_dtype(s.dtype):
+            df[col] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_string_dtype(s.dtype) or s.dtype == object:
+            df[col] = s.astype("category")
+    return df
+
+
+def write_columns(df, path):
+    columns = []
+    for i, col in enumerate(df.columns):
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            np.save(path / f"{i}.codes.npy", s.cat.codes.to_numpy())
+            np.save(path / f"{i}.categories.npy", s.cat.categories.to_numpy(dtype=str))
+            columns.append([col, "category"])
+        else:
+            np.save(path / f"{i}.npy", s.to_numpy())
+            columns.append([col, "array"])
+    return columns
+
+def read_columns(path, meta, columns):
+    index = {name: (i, kind) for i, (name, kind) in enumerate(meta["columns"])}
+    data = {}
+    for name in columns:
+        i, kind = index[name]
+        if kind == "category":
+            data[name] = pd.Categorical.from_codes(np.load(path / f"{i}.codes.npy"), np.load(path / f"{i}.categories.npy").astype(object))
+        else:
+            data[name] = np.load(path / f"{i}.npy")
+    return pd.DataFrame(data)
+
+
+def build(name, data_dir = DATA_DIR, cache_dir = CACHE_DIR):
+    source = Path(data_dir) / f"{name}.csv"
+    path = Path(cache_dir) / name
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True)
+
+    df = typed(pd.read_csv(source))
+    meta = {"version": CACHE_VERSION, "source": fingerprint(source), "rows": len(df)}
+    if has_pyarrow():
+        df.to_parquet(path / "data.parquet")
+        meta["format"] = "parquet"
+        meta["columns"] = [[col, "parquet"] for col in df.columns]
+    else:
+        meta["format"] = "npy"
+        meta["columns"] = write_columns(df, path)
+
+    # metadata last: a cache without it is treated as missing
+    with open(path / "meta.json", "w") as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+def cached_meta(name, data_dir = DATA_DIR, cache_dir = CACHE_DIR):
+    # metadata of an up-to-date cache, or None when it has to be rebuilt
+    meta_path = Path(cache_dir) / name / "meta.json"
+    if not meta_path.exists():
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("version") != CACHE_VERSION or meta["source"] != fingerprint(Path(data_dir) / f"{name}.csv"):
+        return None
+    if meta["format"] == "parquet" and not has_pyarrow():
+        return None
+    return meta
+
+def load_table(name, columns = None, data_dir = DATA_DIR, cache_dir = CACHE_DIR):
+    meta = cached_meta(name, data_dir, cache_dir)
+    if meta is None:
+        meta = build(name, data_dir, cache_dir)
+
+    path = Path(cache_dir) / name
+    columns = [col for col, _ in meta["columns"]] if columns is None else list(columns)
+    if meta["format"] == "parquet":
+        return pd.read_parquet(path / "data.parquet", columns=columns)
+    return read_columns(path, meta, columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the typed caches of the processed CSVs and compare load time and memory")
+    parser.add_argument("tables", nargs="*", default=TABLES)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild even when the CSV is unchanged")
+    args = parser.parse_args()
+
+    print(f"Cache format: {'parquet' if has_pyarrow() else 'npy columns'} in {CACHE_DIR}")
+    print(f"{'table':<26} {'rows':>8} {'csv s':>7} {'csv MB':>7} {'cache s':>8} {'cache MB':>8}")
+    for name in args.tables:
+        source = DATA_DIR / f"{name}.csv"
+        if not source.exists():
+            print(f"{name:<26} missing {source.name}")
+            continue
+        if args.rebuild or cached_meta(name) is None:
+            build(name)
+
+        start = time.perf_counter()
+        csv = pd.read_csv(source)
+        csv_time = time.perf_counter() - start
+        start = time.perf_counter()
+        df = load_table(name)
+        cache_time = time.perf_counter() - start
+
+        csv_mb = csv.memory_usage(deep=True).sum() / 2 ** 20
+        cache_mb = df.memory_usage(deep=True).sum() / 2 ** 20
+        print(f"{name:<26} {len(df):>8} {csv_time:>7.3f} {csv_mb:>7.2f} {cache_time:>8.3f} {cache_mb:>8.2f}")
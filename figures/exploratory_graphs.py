@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 from pathlib import Path
+from data_cache import load_table
 import matplotlib.pyplot as plt
 
 plt.rcParams.update({
@@ -25,21 +26,11 @@ def apply_standard_axes(ax, *, grid=True):
         ax.grid(alpha=plt.rcParams["grid.alpha"], linestyle=plt.rcParams["grid.linestyle"])
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DATA_DIR = PROJECT_ROOT / "data_processing" / "processed_data"
 SAVE_DIR = PROJECT_ROOT / "figures" / "graphs"
 
-ends   = pd.read_csv(DATA_DIR / "ends_processed.csv")
-games  = pd.read_csv(DATA_DIR / "games_processed.csv")
-stones = pd.read_csv(DATA_DIR / "stones_processed.csv")
-ends_counterfactual = pd.read_csv(DATA_DIR / "ends_with_counterfactual.csv")
-
-if "Used_PP" not in ends.columns and "PowerPlayBool" in ends.columns:
-    ends = ends.rename(columns={"PowerPlayBool": "Used_PP"})
-
-required = ["Used_PP", "Has_Hammer", "Result", "EndID", "GameUID", "TeamID"]
-missing = [c for c in required if c not in ends.columns]
-if missing:
-    raise KeyError(f"Missing columns in ends: {missing}\nAvailable: {list(ends.columns)}")
+ends_counterfactual = load_table("ends_with_counterfactual", columns=[
+    "GameUID", "EndID", "TeamID", "Result", "Result_No_PP", "Used_PP", "Has_Hammer"
+])
 
 
 
@@ -51,7 +42,7 @@ tmp = ends_counterfactual.loc[
     ["GameUID", "Result", "Result_No_PP"],
 ].copy()
 tmp["delta"] = tmp["Result"] - tmp["Result_No_PP"]
-game_level_effect = tmp.groupby("GameUID", as_index=False).agg(PP_Gain=("delta", "sum"))
+game_level_effect = tmp.groupby("GameUID", as_index=False, observed=True).agg(PP_Gain=("delta", "sum"))
 
 x = game_level_effect["PP_Gain"].dropna().to_numpy()
 mean_x = x.mean()
@@ -86,17 +77,17 @@ plt.show()
 ends_with_context = ends_counterfactual.sort_values(["GameUID", "EndID"]).copy()
 
 ends_with_context["Opponent_Result"] = (
-    ends_with_context.groupby(["GameUID", "EndID"])["Result"]
+    ends_with_context.groupby(["GameUID", "EndID"], observed=True)["Result"]
     .transform(lambda s: s.iloc[::-1].to_numpy())
 )
 
 ends_with_context = ends_with_context.sort_values(["GameUID", "TeamID", "EndID"])
-ends_with_context["Cumulative_Score"] = ends_with_context.groupby(["GameUID", "TeamID"])["Result"].cumsum()
-ends_with_context["Opponent_Cumulative"] = ends_with_context.groupby(["GameUID", "TeamID"])["Opponent_Result"].cumsum()
+ends_with_context["Cumulative_Score"] = ends_with_context.groupby(["GameUID", "TeamID"], observed=True)["Result"].cumsum()
+ends_with_context["Opponent_Cumulative"] = ends_with_context.groupby(["GameUID", "TeamID"], observed=True)["Opponent_Result"].cumsum()
 
 ends_with_context["Score_Diff_Before"] = (
-    ends_with_context.groupby(["GameUID", "TeamID"])["Cumulative_Score"].shift(1).fillna(0)
-    - ends_with_context.groupby(["GameUID", "TeamID"])["Opponent_Cumulative"].shift(1).fillna(0)
+    ends_with_context.groupby(["GameUID", "TeamID"], observed=True)["Cumulative_Score"].shift(1).fillna(0)
+    - ends_with_context.groupby(["GameUID", "TeamID"], observed=True)["Opponent_Cumulative"].shift(1).fillna(0)
 )
 
 
@@ -122,7 +113,7 @@ pp_success_context["Game_Context"] = np.select(
 pp_success_context["PP_Gain"] = pp_success_context["Result"] - pp_success_context["Result_No_PP"]
 
 pp_context_summary = (
-    pp_success_context.groupby(["EndID", "Game_Context"], as_index=False)
+    pp_success_context.groupby(["EndID", "Game_Context"], as_index=False, observed=True)
     .agg(Avg_PP_Gain=("PP_Gain", "mean"), N=("PP_Gain", "size"))
 )
 pp_context_summary = pp_context_summary.loc[pp_context_summary["N"] >= 5].copy()
@@ -1,13 +1,14 @@
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from data_cache import load_table
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DATA_DIR = PROJECT_ROOT / "data_processing" / "processed_data"
 SAVE_DIR = PROJECT_ROOT / "figures" / "analysis" / "data_analysis"
 
-stones = pd.read_csv(DATA_DIR / "stones_processed.csv")
-ends   = pd.read_csv(DATA_DIR / "ends_with_counterfactual.csv")
+# Result and Has_Hammer are in both tables; the merges below rely on their _x / _y suffixes
+stones = load_table("stones_processed", columns=["GameUID", "EndID", "TeamID", "ShotID", "Task", "Points", "Result", "Has_Hammer"])
+ends   = load_table("ends_with_counterfactual", columns=["GameUID", "EndID", "TeamID", "Result", "Has_Hammer", "Used_PP"])
 
 task_labels = {
     "0":  "Draw",
@@ -43,7 +44,7 @@ opening_shot_nonhammer = (
 
 opening_shot_summary = (
     opening_shot_nonhammer
-        .groupby(["Task", "Opponent_PP"], dropna=False)
+        .groupby(["Task", "Opponent_PP"], dropna=False, observed=True)
         .agg(
             Avg_Execution=("Points", lambda s: np.nanmean(s.to_numpy())),
             Avg_End_Points=("Result_y", lambda s: np.nanmean(s.to_numpy())),
@@ -82,7 +83,7 @@ tmp["w_end"]  = tmp["Avg_End_Points"] * tmp["N"]
 tmp["w_big"]  = tmp["Big_End_Rate"] * tmp["N"]
 
 opening_shot_summary = (
-    tmp.groupby(["Shot_Type", "Opponent_PP"], dropna=False, as_index=False)
+    tmp.groupby(["Shot_Type", "Opponent_PP"], dropna=False, as_index=False, observed=True)
        .agg(
            w_exec=("w_exec", "sum"),
            w_end=("w_end", "sum"),
@@ -123,7 +124,7 @@ hammer_response = hammer_response.loc[hammer_response["Has_Hammer_Stone"] == 1]
 response_analysis = (
     hammer_response
         .merge(first_shot, on=["GameUID", "EndID"], how="inner")
-        .groupby(["First_Task", "Task", "Used_PP"], dropna=False)
+        .groupby(["First_Task", "Task", "Used_PP"], dropna=False, observed=True)
         .agg(
             Avg_Execution=("Points", lambda s: np.nanmean(s.to_numpy())),
             Avg_End_Points=("Result_y", lambda s: np.nanmean(s.to_numpy())),